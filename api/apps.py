@@ -1,6 +1,16 @@
+import atexit
+
 from django.apps import AppConfig
+from django.core.signals import request_finished
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from api import presence
+
+        # Buffered presence must not wait for the next touch to be written.
+        request_finished.connect(presence.flush_due, dispatch_uid='api.presence.flush_due')
+        atexit.register(presence.flush_at_exit)
@@ -0,0 +1,326 @@
+"""
+Batched writes for clients that replay actions queued while offline.
+
+``apply`` runs an ordered list of likes, unlikes, comments, subscriptions
+and messages as one member, in one transaction, and returns one result per
+operation: the status and body the single-action endpoint would have
+answered. Each operation is checked against the state the operations before
+it leave behind, so "like, unlike, like" of one post is three successes.
+Nothing is written until every operation has been checked; then each table
+gets one ``bulk_create`` or DELETE, the counters one UPDATE per table, and
+the dialog list one update per dialog side. Likes and subscriptions only
+reach the database as their net change: a like undone later in the same
+batch is reported as applied but never inserted, and a subscription undone
+that way is reported with a null id. They are inserted with ``ON CONFLICT
+DO NOTHING`` and deleted with ``RETURNING`` (see api.toggles), and their
+counters follow the rows actually written, so a toggle of the same row
+committed concurrently is neither an error nor counted twice.
+
+An operation may carry a client-generated ``key``. Its result is stored in
+the same transaction, and an operation whose key the member has used in the
+last BATCH_IDEMPOTENCY_TTL seconds is not applied again; the stored result
+is returned with ``replayed: true``, so a client that lost the response can
+resend the whole batch. Reusing a key for a different operation is a 409.
+"""
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from api import conversations, counters, feed, notify, response_cache, toggles
+from api.models import Comment, IdempotencyRecord, Like, Member, Message, Post, Subscription
+from api.serializers import (
+    CommentCreateSerializer,
+    CommentSerializer,
+    MessageCreateSerializer,
+    MessageSerializer,
+    SubscriptionSerializer,
+)
+
+
+POST_OPERATIONS = {'like', 'unlike', 'comment'}
+MEMBER_OPERATIONS = {'subscribe', 'unsubscribe', 'message'}
+
+POST_NOT_FOUND = {"error": "Not found", "detail": "Post not found"}
+USER_NOT_FOUND = {"error": "Not found", "detail": "User not found"}
+KEY_REUSED = {"error": "Conflict", "detail": "This idempotency key was already used for a different operation"}
+
+
+def key_ttl():
+    return getattr(settings, 'BATCH_IDEMPOTENCY_TTL', 24 * 60 * 60)
+
+
+class Result:
+    """The outcome of one operation; ``body`` may be a callable until the rows it shows are written."""
+
+    def __init__(self, operation, status, body, replayed=False):
+        self.operation = operation
+        self.status = status
+        self.body = body
+        self.replayed = replayed
+
+    def render(self):
+        if callable(self.body):
+            self.body = self.body()
+        return {
+            'op': self.operation['op'],
+            'key': self.operation.get('key'),
+            'status': self.status,
+            'body': self.body,
+            'replayed': self.replayed,
+        }
+
+
+class Batch:
+    """Checks operations against in-memory state, then writes their net effect."""
+
+    def __init__(self, member, operations):
+        self.member = member
+        self.stored = self._stored_results([op['key'] for op in operations if 'key' in op])
+        pending = [op for op in operations if op.get('key') not in self.stored]
+
+        post_ids = {op['id'] for op in pending if op['op'] in POST_OPERATIONS}
+        member_ids = {op['id'] for op in pending if op['op'] in MEMBER_OPERATIONS}
+        like_ids = {op['id'] for op in pending if op['op'] in ('like', 'unlike')}
+        target_ids = {op['id'] for op in pending if op['op'] in ('subscribe', 'unsubscribe')}
+
+        self.posts = {
+            row['id']: row
+            for row in Post.objects.filter(id__in=post_ids).order_by().values('id', 'author_id', 'likes_count')
+        } if post_ids else {}
+        self.members = Member.objects.only('id').order_by().in_bulk(member_ids) if member_ids else {}
+        self.liked = set(
+            Like.objects.filter(user=member, post_id__in=like_ids).order_by().values_list('post_id', flat=True)
+        ) if like_ids else set()
+        self.subscribed = set(
+            Subscription.objects.filter(subscriber=member, target_id__in=target_ids)
+            .order_by().values_list('target_id', flat=True)
+        ) if target_ids else set()
+        self.initially_subscribed = set(self.subscribed)
+
+        self.likes_added, self.likes_removed = set(), set()
+        self.subscriptions_added, self.subscriptions_removed = {}, set()
+        self.comments, self.messages = [], []
+        self.post_deltas, self.member_deltas = {}, {}
+        self.changed_authors = set()
+        self.used_keys = {}
+
+    def _stored_results(self, keys):
+        if not keys:
+            return {}
+        records = IdempotencyRecord.objects.filter(member=self.member)
+        records.filter(created_at__lt=timezone.now() - timedelta(seconds=key_ttl())).delete()
+        return {record.key: record for record in records.filter(key__in=keys).order_by()}
+
+    def run(self, operation):
+        key = operation.get('key')
+        fingerprint = (operation['op'], operation['id'])
+        if key in self.stored:
+            record = self.stored[key]
+            if (record.operation, record.target_id) != fingerprint:
+                return Result(operation, 409, KEY_REUSED)
+            return Result(operation, record.status, record.body, replayed=True)
+        if key in self.used_keys:
+            earlier = self.used_keys[key]
+            if (earlier.operation['op'], earlier.operation['id']) != fingerprint:
+                return Result(operation, 409, KEY_REUSED)
+            return Result(operation, earlier.status, lambda: earlier.render()['body'], replayed=True)
+
+        result = Result(operation, *getattr(self, operation['op'])(operation))
+        if key is not None:
+            self.used_keys[key] = result
+        return result
+
+    @staticmethod
+    def _adjust(deltas, pk, **changes):
+        row = deltas.setdefault(pk, {})
+        for field, delta in changes.items():
+            row[field] = row.get(field, 0) + delta
+
+    def _adjust_post(self, post, **deltas):
+        self._adjust(self.post_deltas, post['id'], **deltas)
+        self.changed_authors.add(post['author_id'])
+
+    def like(self, operation):
+        post = self.posts.get(operation['id'])
+        if post is None:
+            return 404, POST_NOT_FOUND
+        if post['id'] in self.liked:
+            return 400, {"error": "Already liked", "detail": "You have already liked this post"}
+
+        self.liked.add(post['id'])
+        if post['id'] in self.likes_removed:
+            self.likes_removed.discard(post['id'])
+        else:
+            self.likes_added.add(post['id'])
+        post['likes_count'] += 1
+        self.changed_authors.add(post['author_id'])
+        return 201, {"message": "Post liked successfully", "likes_count": post['likes_count']}
+
+    def unlike(self, operation):
+        post = self.posts.get(operation['id'])
+        if post is None:
+            return 404, POST_NOT_FOUND
+        if post['id'] not in self.liked:
+            return 400, {"error": "Not liked yet", "detail": "You have not liked this post yet"}
+
+        self.liked.discard(post['id'])
+        if post['id'] in self.likes_added:
+            self.likes_added.discard(post['id'])
+        else:
+            self.likes_removed.add(post['id'])
+        post['likes_count'] -= 1
+        self.changed_authors.add(post['author_id'])
+        return 200, {"message": "Post unliked successfully", "likes_count": post['likes_count']}
+
+    def comment(self, operation):
+        post = self.posts.get(operation['id'])
+        if post is None:
+            return 404, POST_NOT_FOUND
+        serializer = CommentCreateSerializer(data=_content(operation))
+        if not serializer.is_valid():
+            return 400, serializer.errors
+
+        comment = Comment(author=self.member, post_id=post['id'], **serializer.validated_data)
+        self.comments.append(comment)
+        self._adjust_post(post, comments_count=1)
+        return 201, lambda: CommentSerializer(comment).data
+
+    def subscribe(self, operation):
+        target = self.members.get(operation['id'])
+        if target is None:
+            return 404, USER_NOT_FOUND
+        if target.id == self.member.id:
+            return 400, {"error": "Invalid operation", "detail": "Cannot subscribe to yourself"}
+        if target.id in self.subscribed:
+            return 400, {"error": "Already subscribed", "detail": "You are already subscribed to this user"}
+
+        self.subscribed.add(target.id)
+        subscription = self.subscriptions_added[target.id] = Subscription(subscriber=self.member, target=target)
+        return 201, lambda: {
+            "message": "Successfully subscribed",
+            "subscription": SubscriptionSerializer(subscription).data,
+        }
+
+    def unsubscribe(self, operation):
+        target = self.members.get(operation['id'])
+        if target is None:
+            return 404, USER_NOT_FOUND
+        if target.id not in self.subscribed:
+            return 404, {"error": "Not found", "detail": "Subscription not found"}
+
+        self.subscribed.discard(target.id)
+        if self.subscriptions_added.pop(target.id, None) is None:
+            self.subscriptions_removed.add(target.id)
+        return 200, {"message": "Successfully unsubscribed"}
+
+    def message(self, operation):
+        receiver = self.members.get(operation['id'])
+        if receiver is None:
+            return 404, USER_NOT_FOUND
+        serializer = MessageCreateSerializer(data=_content(operation))
+        if not serializer.is_valid():
+            return 400, serializer.errors
+
+        message = Message(sender=self.member, receiver=receiver, **serializer.validated_data)
+        self.messages.append(message)
+        return 201, lambda: MessageSerializer(message).data
+
+    def write(self):
+        member = self.member
+        now = timezone.now()
+        # Counters move by the rows written, not the operations checked: a
+        # like or subscription toggled by another request since this batch
+        # read its state was skipped by the statement and is not counted.
+        if self.likes_removed:
+            for post_id, in toggles.delete_returning(
+                Like, ['post_id'], user_id=member.id, post_id__in=self.likes_removed,
+            ):
+                self._adjust(self.post_deltas, post_id, likes_count=-1)
+        if self.likes_added:
+            for post_id, in toggles.insert_ignore_many(
+                Like,
+                [{'user_id': member.id, 'post_id': post_id, 'created_at': now} for post_id in sorted(self.likes_added)],
+                ['post_id'],
+            ):
+                self._adjust(self.post_deltas, post_id, likes_count=1)
+        if self.comments:
+            Comment.objects.bulk_create(self.comments)
+        counters.adjust_many(Post, self.post_deltas)
+        for author_id in self.changed_authors:
+            response_cache.posts_changed(author_id)
+
+        # Removed first: a subscription removed and added again is a new row.
+        removed, added = set(), set()
+        if self.subscriptions_removed:
+            removed = {target_id for target_id, in toggles.delete_returning(
+                Subscription, ['target_id'], subscriber_id=member.id, target_id__in=self.subscriptions_removed,
+            )}
+        if self.subscriptions_added:
+            for subscription in self.subscriptions_added.values():
+                subscription.created_at = now
+            inserted = toggles.insert_ignore_many(
+                Subscription,
+                [
+                    {'subscriber_id': member.id, 'target_id': target_id, 'created_at': now}
+                    for target_id in sorted(self.subscriptions_added)
+                ],
+                ['id', 'target_id'],
+            )
+            # One that conflicted was created concurrently; it keeps a null id here.
+            for pk, target_id in inserted:
+                self.subscriptions_added[target_id].id = pk
+                added.add(target_id)
+        for target_id in removed:
+            self._adjust(self.member_deltas, target_id, followers_count=-1)
+        for target_id in added:
+            self._adjust(self.member_deltas, target_id, followers_count=1)
+        self._adjust(self.member_deltas, member.id, following_count=len(added) - len(removed))
+        counters.adjust_many(Member, self.member_deltas)
+        for target_id in (self.initially_subscribed - self.subscribed) & removed:
+            feed.prune(member.id, target_id)
+            feed.catch_up(target_id)
+        for target_id in (self.subscribed - self.initially_subscribed) & added:
+            feed.backfill(member.id, target_id)
+
+        if self.messages:
+            Message.objects.bulk_create(self.messages)
+            conversations.record_messages(self.messages)
+            latest = {message.receiver_id: message.id for message in self.messages}
+            for receiver_id, message_id in latest.items():
+                transaction.on_commit(partial(notify.messages.notify, receiver_id, message_id))
+
+    def store(self, results):
+        """Keep the results of keyed operations that were applied (not replayed or rejected as reused)."""
+        IdempotencyRecord.objects.bulk_create([
+            IdempotencyRecord(
+                member=self.member,
+                key=result['key'],
+                operation=result['op'],
+                target_id=operation['id'],
+                status=result['status'],
+                body=result['body'],
+            )
+            for operation, result in results
+            if result['key'] is not None and not result['replayed'] and result['status'] != 409
+        ])
+
+
+def _content(operation):
+    return {'content': operation['content']} if 'content' in operation else {}
+
+
+def apply(member, operations):
+    """
+    Apply ``operations`` (``BatchSerializer`` data) as ``member`` in one
+    transaction and return their results in order.
+    """
+    with transaction.atomic():
+        batch = Batch(member, operations)
+        results = [batch.run(operation) for operation in operations]
+        batch.write()
+        rendered = [result.render() for result in results]
+        batch.store(zip(operations, rendered))
+    return rendered
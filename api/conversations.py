@@ -0,0 +1,100 @@
+"""
+Maintenance of the ``Conversation`` read model.
+
+Every write to ``messages`` that changes what the dialog list shows goes
+through one of these functions, inside the same transaction as the write.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import Case, F, Q, Value, When
+
+from api.models import Conversation, Message
+from api.pagination import combine
+
+
+def _sides(message):
+    """(owner, participant, unread increment) for both rows of the pair."""
+    if message.sender_id == message.receiver_id:
+        return [(message.sender_id, message.receiver_id, 0)]
+    return [
+        (message.sender_id, message.receiver_id, 0),
+        (message.receiver_id, message.sender_id, 1),
+    ]
+
+
+def dialog_arms(member_id, other_id):
+    """
+    Messages between two members as one queryset per direction, each served
+    by the (sender, receiver, created_at) index; page them with ``combine``.
+    """
+    arms = [Message.objects.filter(sender_id=member_id, receiver_id=other_id)]
+    if member_id != other_id:
+        arms.append(Message.objects.filter(sender_id=other_id, receiver_id=member_id))
+    return arms
+
+
+def record_message(message):
+    """Make ``message`` the latest one of its dialog on both sides."""
+    record_messages([message])
+
+
+def record_messages(messages):
+    """
+    ``record_message`` for ``messages`` in the order they were sent: one
+    insert for the dialog rows that do not exist yet and one update for all
+    of them, however many dialogs the messages belong to.
+    """
+    latest = {}
+    for message in messages:
+        for owner_id, participant_id, unread in _sides(message):
+            _, total = latest.get((owner_id, participant_id), (None, 0))
+            latest[owner_id, participant_id] = (message, total + unread)
+    if not latest:
+        return
+
+    Conversation.objects.bulk_create(
+        [Conversation(owner_id=owner_id, participant_id=participant_id) for owner_id, participant_id in latest],
+        ignore_conflicts=True,
+    )
+
+    def per_side(value):
+        return Case(*[
+            When(owner_id=owner_id, participant_id=participant_id, then=Value(value(message, unread)))
+            for (owner_id, participant_id), (message, unread) in latest.items()
+        ])
+
+    Conversation.objects.filter(
+        reduce(or_, [Q(owner_id=owner_id, participant_id=participant_id) for owner_id, participant_id in latest])
+    ).update(
+        last_message_id=per_side(lambda message, unread: message.id),
+        last_message_at=per_side(lambda message, unread: message.created_at),
+        unread_count=F('unread_count') + per_side(lambda message, unread: unread),
+    )
+
+
+def mark_read(owner_id, participant_id):
+    Conversation.objects.filter(
+        owner_id=owner_id,
+        participant_id=participant_id,
+        unread_count__gt=0,
+    ).update(unread_count=0)
+
+
+def message_deleted(message):
+    """Point both rows at the previous message, or drop them if none is left."""
+    remaining = combine(dialog_arms(message.sender_id, message.receiver_id))[:1]
+    latest = next(iter(remaining), None)
+    for owner_id, participant_id, _ in _sides(message):
+        rows = Conversation.objects.filter(owner_id=owner_id, participant_id=participant_id)
+        if latest is None:
+            rows.delete()
+        else:
+            rows.update(last_message=latest, last_message_at=latest.created_at)
+
+    if not message.is_read and message.sender_id != message.receiver_id:
+        Conversation.objects.filter(
+            owner_id=message.receiver_id,
+            participant_id=message.sender_id,
+            unread_count__gt=0,
+        ).update(unread_count=F('unread_count') - 1)
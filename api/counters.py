@@ -0,0 +1,99 @@
+"""
+Denormalized engagement counters.
+
+Counter columns on ``Post`` and ``Member`` are adjusted with F-expressions
+inside the same transaction as the row they count. ``reconcile`` recomputes
+them from the source tables and is used by the ``reconcile_counters``
+management command to repair drift (e.g. after cascading deletes).
+"""
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from api.models import Member, Post, Like, Comment, Subscription
+
+
+# counter field -> (source model, foreign key on the source pointing back)
+COUNTERS = {
+    Post: {
+        'likes_count': (Like, 'post'),
+        'comments_count': (Comment, 'post'),
+    },
+    Member: {
+        'followers_count': (Subscription, 'target'),
+        'following_count': (Subscription, 'subscriber'),
+        'posts_count': (Post, 'author'),
+    },
+}
+
+
+def adjust(model, pk, **deltas):
+    """Atomically add ``deltas`` to counter columns of a single row and bump its ``updated_at``."""
+    return model.objects.filter(pk=pk).update(
+        updated_at=timezone.now(),
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def adjust_many(model, deltas):
+    """
+    ``adjust`` for several rows in one statement. ``deltas`` maps primary
+    keys to ``{field: delta}``; rows whose deltas are all zero are left alone.
+    """
+    deltas = {pk: changes for pk, changes in deltas.items() if any(changes.values())}
+    if not deltas:
+        return 0
+    fields = dict.fromkeys(field for changes in deltas.values() for field in changes)
+    return model.objects.filter(pk__in=deltas).update(
+        updated_at=timezone.now(),
+        **{
+            field: F(field) + Case(
+                *[When(pk=pk, then=Value(changes[field])) for pk, changes in deltas.items() if changes.get(field)],
+                default=Value(0),
+            )
+            for field in fields
+        }
+    )
+
+
+def actual_count(model, field):
+    """Subquery expression computing the true value of a counter column."""
+    source, fk = COUNTERS[model][field]
+    subquery = (
+        source.objects.filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(subquery), 0)
+
+
+def reconcile(model, start_id, end_id, repair=True):
+    """
+    Compare stored counters of rows with ``start_id <= id < end_id`` against
+    the source tables. Returns a list of ``(id, field, stored, actual)`` for
+    every drifted value and, unless ``repair`` is False, rewrites them.
+    """
+    fields = list(COUNTERS[model])
+    rows = (
+        model.objects.filter(pk__gte=start_id, pk__lt=end_id)
+        .order_by()
+        .annotate(**{f'actual_{field}': actual_count(model, field) for field in fields})
+        .values('pk', *fields, *[f'actual_{field}' for field in fields])
+    )
+
+    drift = []
+    for row in rows:
+        for field in fields:
+            if row[field] != row[f'actual_{field}']:
+                drift.append((row['pk'], field, row[field], row[f'actual_{field}']))
+
+    if repair:
+        for field in fields:
+            ids = [pk for pk, drifted, _, _ in drift if drifted == field]
+            if ids:
+                model.objects.filter(pk__in=ids).update(
+                    updated_at=timezone.now(), **{field: actual_count(model, field)}
+                )
+    return drift
@@ -0,0 +1,131 @@
+"""
+Streaming export of everything a member has created or received.
+
+Each section is read with ``QuerySet.iterator(chunk_size=...)`` over
+``values()`` rows and encoded as it arrives, so memory use does not grow
+with the size of the account. ``ndjson`` writes one JSON object per line,
+tagged with its section; ``zip`` writes one NDJSON file per section.
+"""
+import json
+import zipfile
+from urllib.parse import quote
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from api.models import Comment, Like, Member, Message, Post, Subscription
+
+CHUNK_SIZE = 2000
+
+# Bytes to collect before handing a piece of the response to the server.
+FLUSH_SIZE = 64 * 1024
+
+PROFILE_FIELDS = [
+    'id', 'username', 'email', 'first_name', 'last_name', 'avatar', 'bio',
+    'followers_count', 'following_count', 'posts_count', 'created_at',
+]
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'zip': 'application/zip',
+}
+
+
+def sections(member):
+    """(section, queryset of dicts) pairs, each ordered along an index."""
+    return [
+        ('posts', Post.objects.filter(author=member).order_by('id').values(
+            'id', 'content', 'image', 'likes_count', 'comments_count', 'created_at')),
+        ('comments', Comment.objects.filter(author=member).order_by('id').values(
+            'id', 'post_id', 'content', 'created_at')),
+        ('likes', Like.objects.filter(user=member).order_by('id').values(
+            'post_id', 'created_at')),
+        ('subscriptions', Subscription.objects.filter(subscriber=member).order_by('id').values(
+            'target_id', 'target__username', 'created_at')),
+        ('subscribers', Subscription.objects.filter(target=member).order_by('id').values(
+            'subscriber_id', 'subscriber__username', 'created_at')),
+        ('messages_sent', Message.objects.filter(sender=member).order_by('id').values(
+            'id', 'receiver_id', 'content', 'is_read', 'created_at')),
+        ('messages_received', Message.objects.filter(receiver=member).order_by('id').values(
+            'id', 'sender_id', 'content', 'is_read', 'created_at')),
+    ]
+
+
+def profile(member):
+    return Member.objects.filter(pk=member.pk).values(*PROFILE_FIELDS).get()
+
+
+def encode(row):
+    return json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+def ndjson(member, chunk_size=CHUNK_SIZE):
+    """Yield the export as NDJSON in pieces of roughly FLUSH_SIZE bytes."""
+    pending = bytearray(encode({'type': 'profile', **profile(member)}))
+    for section, queryset in sections(member):
+        for row in queryset.iterator(chunk_size=chunk_size):
+            pending += encode({'type': section, **row})
+            if len(pending) >= FLUSH_SIZE:
+                yield bytes(pending)
+                pending.clear()
+    if pending:
+        yield bytes(pending)
+
+
+class _Pipe:
+    """Write-only file object whose contents are taken out as they are produced."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def zipped(member, chunk_size=CHUNK_SIZE):
+    """
+    Yield the export as a zip archive with one NDJSON file per section.
+
+    The archive is written to a non-seekable pipe, so zipfile streams each
+    entry with a trailing data descriptor instead of seeking back.
+    """
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('profile.json', json.dumps(profile(member), cls=DjangoJSONEncoder, indent=2))
+        for section, queryset in sections(member):
+            with archive.open(f'{section}.ndjson', 'w', force_zip64=True) as entry:
+                for row in queryset.iterator(chunk_size=chunk_size):
+                    entry.write(encode(row))
+                    if len(pipe.buffer) >= FLUSH_SIZE:
+                        yield pipe.take()
+            yield pipe.take()
+    yield pipe.take()
+
+
+def stream(member, format='ndjson', chunk_size=CHUNK_SIZE):
+    if format == 'zip':
+        return zipped(member, chunk_size)
+    return ndjson(member, chunk_size)
+
+
+def filename(member, format='ndjson'):
+    return f'export-{member.username}.{format}'
+
+
+def content_disposition(member, format='ndjson'):
+    """
+    ``Content-Disposition`` for a download of ``filename``. Usernames are not
+    restricted to safe characters, so ``filename`` is only sent RFC 5987
+    encoded, next to a plain ASCII fallback built from the member id.
+    """
+    return "attachment; filename=\"export-{}.{}\"; filename*=UTF-8''{}".format(
+        member.id, format, quote(filename(member, format), safe=''),
+    )
@@ -0,0 +1,147 @@
+"""
+Home feed built from materialized per-member timelines.
+
+Posts are fanned out on write into ``TimelineEntry`` rows for every
+subscriber of the author. Authors with more subscribers than
+``FEED_FANOUT_THRESHOLD`` are skipped on write and merged in on read
+instead, so a single post never turns into a huge insert. When an
+unsubscribe takes an author back below the threshold they stop being merged
+in, so ``catch_up`` first writes their recent posts, including those made
+while they were above it, into the remaining subscribers' timelines.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from api.models import Member, Post, Subscription, TimelineEntry
+
+
+def fanout_threshold():
+    return getattr(settings, 'FEED_FANOUT_THRESHOLD', 10000)
+
+
+def backfill_limit():
+    return getattr(settings, 'FEED_BACKFILL_LIMIT', 100)
+
+
+def batch_size():
+    return getattr(settings, 'FEED_FANOUT_BATCH_SIZE', 1000)
+
+
+def follower_count(member_id):
+    return Member.objects.filter(id=member_id).values_list('followers_count', flat=True).first() or 0
+
+
+def is_high_fanout(member_id):
+    return follower_count(member_id) >= fanout_threshold()
+
+
+def fan_out_post(post):
+    """Write a new post into the timelines of the author's subscribers."""
+    if is_high_fanout(post.author_id):
+        return 0
+
+    follower_ids = (
+        Subscription.objects.filter(target_id=post.author_id)
+        .values_list('subscriber_id', flat=True)
+        .iterator(chunk_size=batch_size())
+    )
+    written = 0
+    entries = []
+    for follower_id in follower_ids:
+        entries.append(TimelineEntry(
+            owner_id=follower_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            created_at=post.created_at,
+        ))
+        if len(entries) >= batch_size():
+            TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+            written += len(entries)
+            entries = []
+    if entries:
+        TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+        written += len(entries)
+    return written
+
+
+def backfill(subscriber_id, target_id):
+    """Copy the target's recent posts into a new subscriber's timeline."""
+    if is_high_fanout(target_id):
+        return 0
+
+    recent = (
+        Post.objects.filter(author_id=target_id)
+        .order_by('-created_at')
+        .values_list('id', 'created_at')[:backfill_limit()]
+    )
+    entries = [
+        TimelineEntry(
+            owner_id=subscriber_id,
+            post_id=post_id,
+            author_id=target_id,
+            created_at=created_at,
+        )
+        for post_id, created_at in recent
+    ]
+    TimelineEntry.objects.bulk_create(entries, batch_size=batch_size(), ignore_conflicts=True)
+    return len(entries)
+
+
+def catch_up(author_id):
+    """
+    Fan out the author's recent posts if they have just dropped below the
+    threshold; call after a subscription to them was removed.
+    """
+    if follower_count(author_id) != fanout_threshold() - 1:
+        return 0
+    recent = list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-created_at')
+        .values_list('id', 'created_at')[:backfill_limit()]
+    )
+    if not recent:
+        return 0
+
+    follower_ids = (
+        Subscription.objects.filter(target_id=author_id)
+        .values_list('subscriber_id', flat=True)
+        .iterator(chunk_size=batch_size())
+    )
+    written = 0
+    entries = []
+    for follower_id in follower_ids:
+        entries.extend(
+            TimelineEntry(owner_id=follower_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for post_id, created_at in recent
+        )
+        if len(entries) >= batch_size():
+            TimelineEntry.objects.bulk_create(entries, batch_size=batch_size(), ignore_conflicts=True)
+            written += len(entries)
+            entries = []
+    if entries:
+        TimelineEntry.objects.bulk_create(entries, batch_size=batch_size(), ignore_conflicts=True)
+        written += len(entries)
+    return written
+
+
+def prune(subscriber_id, target_id):
+    """Remove the target's posts from a former subscriber's timeline."""
+    deleted, _ = TimelineEntry.objects.filter(owner_id=subscriber_id, author_id=target_id).delete()
+    return deleted
+
+
+def pull_author_ids(member_id):
+    """Followed authors whose posts are merged in at read time."""
+    high_fanout = Member.objects.filter(
+        subscribers__subscriber_id=member_id,
+        followers_count__gte=fanout_threshold(),
+    ).order_by().values_list('id', flat=True)
+    return [member_id, *high_fanout]
+
+
+def feed_queryset(member):
+    """Posts for the member's home feed: own posts, timeline and pulled authors."""
+    timeline = TimelineEntry.objects.filter(owner_id=member.id).values('post_id')
+    return Post.objects.filter(
+        Q(id__in=timeline) | Q(author_id__in=pull_author_ids(member.id))
+    )
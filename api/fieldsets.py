@@ -0,0 +1,245 @@
+"""
+Sparse fieldsets for read endpoints: ``?fields=`` and ``?expand=``.
+
+``fields`` is a comma-separated list of the fields to return; a field of an
+embedded object is written ``author.username``. ``expand`` names related
+objects to embed. Without ``fields`` the full representation is returned, as
+before. With it, a related object is embedded only when ``expand`` or a
+dotted field asks for it, and is otherwise returned as its id, so a screen
+that only needs post content does not join the author at all.
+
+A ``Fieldset`` knows which columns its fields are made of. Views pass them
+to ``only()`` (``restrict``) or ``values()`` (``lookups``) so unrequested
+columns such as ``bio``, ``content`` and ``password_hash`` are never read.
+"""
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework.exceptions import ValidationError
+
+
+class Representation:
+    """
+    The fields of a serializer in output order, each with the lookups it is
+    rendered from. ``relations`` maps embedded objects to their foreign key
+    lookup and representation; ``annotations`` are lookups that are not
+    model fields (they are selected by the queryset, not by ``only()``).
+    """
+
+    def __init__(self, columns, relations=None, annotations=()):
+        self.columns = columns
+        self.relations = relations or {}
+        self.annotations = frozenset(annotations)
+
+    @property
+    def names(self):
+        return tuple(self.columns)
+
+
+class Fieldset:
+    def __init__(self, representation, names=None, nested=None):
+        self.representation = representation
+        self.names = representation.names if names is None else names
+        # Fieldsets of the embedded relations; the others render as ids.
+        if nested is None:
+            nested = {
+                name: Fieldset(relation)
+                for name, (_, relation) in representation.relations.items() if name in self.names
+            }
+        self.nested = nested
+
+    def __repr__(self):
+        return f'Fieldset({self.names!r}, {self.nested!r})'
+
+    def lookups(self, *extra, prefix=''):
+        """
+        The ``values()`` lookups needed to render these fields, relative to
+        ``prefix``, followed by ``extra`` (lookups the view needs itself).
+        """
+        lookups = []
+        for name in self.names:
+            if name in self.nested:
+                lookups.extend(self.nested[name].lookups(prefix=f'{prefix}{name}__'))
+            elif name in self.representation.relations:
+                lookups.append(prefix + self.representation.relations[name][0])
+            else:
+                lookups.extend(prefix + lookup for lookup in self.representation.columns[name])
+        return list(dict.fromkeys(lookups + list(extra)))
+
+    def model_lookups(self, prefix=''):
+        """``lookups`` without annotations, for ``only()``."""
+        lookups = []
+        for name in self.names:
+            if name in self.nested:
+                lookups.extend(self.nested[name].model_lookups(prefix=f'{prefix}{name}__'))
+            elif name in self.representation.relations:
+                lookups.append(prefix + self.representation.relations[name][0])
+            else:
+                lookups.extend(
+                    prefix + lookup for lookup in self.representation.columns[name]
+                    if lookup not in self.representation.annotations
+                )
+        return list(dict.fromkeys(lookups))
+
+    def restrict(self, queryset, *extra, prefix=''):
+        """
+        ``queryset.only()`` the columns these fields (and ``extra``, which
+        the view needs itself) are rendered from, following only the
+        relations that are still read.
+        """
+        lookups = list(dict.fromkeys(self.model_lookups(prefix) + list(extra)))
+        related = {lookup.rsplit('__', 1)[0] for lookup in lookups if '__' in lookup}
+        return queryset.select_related(None).select_related(*related).only(*lookups)
+
+    def trim(self, fields, serializer_field):
+        """
+        Keep the serializer ``fields`` in this fieldset. Relations that are
+        not expanded are replaced by ``serializer_field(source=<fk>)``.
+        """
+        trimmed = {}
+        for name in self.names:
+            if name in self.representation.relations and name not in self.nested:
+                trimmed[name] = serializer_field(source=self.representation.relations[name][0], read_only=True)
+            else:
+                trimmed[name] = fields[name]
+        return trimmed
+
+
+def _split(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def _invalid(detail):
+    return ValidationError({'error': 'Invalid parameters', 'detail': detail})
+
+
+def parse(request, representation):
+    """
+    The ``Fieldset`` requested by ``request``'s ``fields`` and ``expand``
+    parameters. Raises ``ValidationError`` (400) for unknown names.
+    """
+    params = request.query_params
+    requested = _split(params.get('fields', ''))
+    expand = _split(params.get('expand', ''))
+    relations = representation.relations
+
+    unknown = [name for name in expand if name not in relations]
+    if unknown:
+        raise _invalid(f"Cannot expand {', '.join(unknown)}; expandable: {', '.join(relations) or 'none'}")
+    if not requested:
+        return Fieldset(representation)
+
+    top, children, unknown = set(), {}, []
+    for path in requested:
+        name, _, child = path.partition('.')
+        if name not in representation.columns:
+            unknown.append(path)
+        elif child:
+            if name not in relations or child not in relations[name][1].columns:
+                unknown.append(path)
+            else:
+                children.setdefault(name, []).append(child)
+        top.add(name)
+    if unknown:
+        raise _invalid(f"Unknown field(s): {', '.join(unknown)}")
+
+    top.update(expand)
+    names = tuple(name for name in representation.names if name in top)
+    nested = {}
+    for name in names:
+        if name in children or name in expand:
+            relation = relations[name][1]
+            selected = set(children.get(name, relation.names))
+            nested[name] = Fieldset(relation, tuple(child for child in relation.names if child in selected))
+    return Fieldset(representation, names, nested)
+
+
+MEMBER_SHORT = Representation({
+    'id': ('id',),
+    'username': ('username',),
+    'first_name': ('first_name',),
+    'last_name': ('last_name',),
+    'avatar': ('avatar',),
+    'avatar_variants': ('avatar', 'avatar_variants'),
+    'is_online': ('id', 'is_online', 'last_seen'),
+})
+
+MEMBER = Representation({
+    'id': ('id',),
+    'username': ('username',),
+    'email': ('email',),
+    'first_name': ('first_name',),
+    'last_name': ('last_name',),
+    'avatar': ('avatar',),
+    'avatar_variants': ('avatar', 'avatar_variants'),
+    'bio': ('bio',),
+    'is_online': ('id', 'is_online', 'last_seen'),
+    'last_seen': ('id', 'last_seen'),
+    'followers_count': ('followers_count',),
+    'following_count': ('following_count',),
+    'posts_count': ('posts_count',),
+    'created_at': ('created_at',),
+})
+
+POST = Representation(
+    {
+        'id': ('id',),
+        'author': (),
+        'content': ('content',),
+        'image': ('image',),
+        'image_variants': ('image', 'image_variants'),
+        'likes_count': ('likes_count',),
+        'comments_count': ('comments_count',),
+        'is_liked': ('is_liked',),
+        'created_at': ('created_at',),
+    },
+    relations={'author': ('author_id', MEMBER_SHORT)},
+    annotations=('is_liked',),
+)
+
+POST_SEARCH_RESULT = Representation(
+    # The snippet is selected by search.RankedResults.
+    {**POST.columns, 'snippet': ()},
+    relations=POST.relations,
+    annotations=POST.annotations,
+)
+
+COMMENT = Representation(
+    {
+        'id': ('id',),
+        'author': (),
+        'post': ('post_id',),
+        'content': ('content',),
+        'created_at': ('created_at',),
+    },
+    relations={'author': ('author_id', MEMBER_SHORT)},
+)
+
+MESSAGE = Representation({
+    'id': ('id',),
+    'sender': ('sender_id',),
+    'receiver': ('receiver_id',),
+    'content': ('content',),
+    'is_read': ('is_read',),
+    'created_at': ('created_at',),
+})
+
+
+FIELDSET_PARAMETERS = [
+    OpenApiParameter(
+        name='fields',
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+        description=(
+            "Comma-separated fields to return, e.g. 'id,content,author.username'. "
+            "Related objects not expanded are returned as their id"
+        ),
+        required=False,
+    ),
+    OpenApiParameter(
+        name='expand',
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+        description="Comma-separated related objects to embed when 'fields' is given, e.g. 'author'",
+        required=False,
+    ),
+]
@@ -0,0 +1,189 @@
+"""
+Resized variants of uploaded post images and avatars.
+
+Uploads are stored as sent, which can be a multi-megabyte camera original.
+After the upload's transaction commits, ``schedule`` hands the row to a
+per-worker thread pool that decodes the original once and writes a WebP
+``thumb``, ``medium`` and ``full`` variant next to it. Re-encoding drops
+EXIF, GPS and ICC metadata; EXIF orientation is applied to the pixels
+first. The variant names and dimensions are stored on the row in
+``<field>_variants`` and serializers turn them into URLs; until they exist
+clients fall back to the original. Replacing an image deletes the previous
+original and its variants once the replacement has committed (``discard``).
+
+Pillow releases the GIL while decoding, resizing and encoding, so the pool
+runs in parallel with request threads.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from api import response_cache
+from api.models import Member, Post
+
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels, largest first. Images are never upscaled.
+VARIANTS = {
+    (Post, 'image'): {'full': 1600, 'medium': 800, 'thumb': 320},
+    (Member, 'avatar'): {'full': 512, 'medium': 256, 'thumb': 96},
+}
+
+FORMAT = 'WEBP'
+EXTENSION = 'webp'
+QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def workers():
+    """Size of the thread pool; 0 processes images inline when the transaction commits."""
+    return getattr(settings, 'IMAGE_WORKERS', 2)
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers(), thread_name_prefix='images')
+        return _executor
+
+
+def schedule(instance, field):
+    """Generate variants for ``instance.<field>`` once the current transaction commits."""
+    if getattr(instance, field):
+        transaction.on_commit(partial(_submit, type(instance), instance.pk, field))
+
+
+def discard(instance, field):
+    """
+    Delete the stored ``instance.<field>`` and its recorded variants once the
+    current transaction commits. Call it before the field is replaced, while
+    ``instance`` still holds the old name and variant map.
+    """
+    file = getattr(instance, field)
+    if not file:
+        return
+    variants = getattr(instance, f'{field}_variants') or {}
+    names = [file.name] + [variant['name'] for variant in variants.values()]
+    transaction.on_commit(partial(_delete, file.storage, names))
+
+
+def _delete(storage, names):
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.warning('Could not delete superseded image %s', name, exc_info=True)
+
+
+def _submit(model, pk, field):
+    if workers() == 0:
+        process(model, pk, field)
+    else:
+        executor().submit(_run, model, pk, field)
+
+
+def _run(model, pk, field):
+    try:
+        process(model, pk, field)
+    except Exception:
+        logger.exception('Generating %s variants for %s %s failed', field, model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def render(source, sizes):
+    """
+    Encode ``source`` (a binary file object) at every size in ``sizes``.
+
+    Returns ``{variant: (bytes, width, height)}``. Each variant is reduced
+    from the previous, larger one, and JPEG originals are decoded at a
+    reduced scale when they are much larger than the biggest variant.
+    """
+    with Image.open(source) as original:
+        largest = max(sizes.values())
+        original.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    encoded = {}
+    for variant, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, FORMAT, quality=QUALITY, method=4)
+        encoded[variant] = (buffer.getvalue(), image.width, image.height)
+    return encoded
+
+
+def process(model, pk, field):
+    """
+    Write the variants of one row's image and record them on the row.
+
+    The row is only updated if it still points at the image that was
+    processed; otherwise the files are removed again. Returns the stored
+    variant map, or None if there was nothing (left) to do.
+    """
+    fields = [field, 'author_id'] if model is Post else [field]
+    instance = model.objects.filter(pk=pk).only(*fields).first()
+    file = getattr(instance, field, None)
+    if not file:
+        return None
+
+    try:
+        with file.open('rb'):
+            encoded = render(file, VARIANTS[model, field])
+    except (OSError, Image.DecompressionBombError, SyntaxError, ValueError):
+        logger.warning('Could not read %s as an image', file.name, exc_info=True)
+        return None
+
+    stem = os.path.splitext(file.name)[0]
+    variants = {}
+    for variant, (data, width, height) in encoded.items():
+        name = file.storage.save(f'{stem}_{variant}.{EXTENSION}', ContentFile(data))
+        variants[variant] = {'name': name, 'width': width, 'height': height}
+
+    updated = model.objects.filter(pk=pk, **{field: file.name}).update(
+        updated_at=timezone.now(), **{f'{field}_variants': variants}
+    )
+    if not updated:
+        for variant in variants.values():
+            file.storage.delete(variant['name'])
+        return None
+    response_cache.posts_changed(instance.author_id if model is Post else pk)
+    return variants
+
+
+def urls(variants, field_file, request=None):
+    """
+    ``{variant: {url, width, height}}`` for a stored variant map, or None
+    when the variants are not ready (or there is no image).
+    """
+    if not field_file:
+        return None
+    return stored_urls(variants, field_file.storage, request)
+
+
+def stored_urls(variants, storage, request=None):
+    """``urls`` for a variant map read without its image field (``values()`` rows)."""
+    if not variants:
+        return None
+    result = {}
+    for variant, stored in variants.items():
+        url = storage.url(stored['name'])
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        result[variant] = {'url': url, 'width': stored['width'], 'height': stored['height']}
+    return result
@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from config.sqlite import PROFILES, pragma_statements
+
+
+def _writer(path, profile, worker, seconds, results):
+    """One simulated gunicorn worker: short read-then-write transactions."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    for statement in pragma_statements(profile):
+        conn.execute(statement)
+    begin = f"BEGIN {PROFILES[profile]['transaction_mode'] or ''}".strip()
+
+    commits = 0
+    locked = 0
+    latencies = []
+    deadline = time.monotonic() + seconds
+    n = 0
+    while time.monotonic() < deadline:
+        n += 1
+        post_id = n % 100
+        started = time.perf_counter()
+        try:
+            conn.execute(begin)
+            conn.execute("SELECT count(*) FROM likes WHERE post_id = ?", [post_id]).fetchone()
+            conn.execute(
+                "INSERT INTO likes (post_id, user_id, created_at) VALUES (?, ?, datetime('now'))",
+                [post_id, worker * 10_000_000 + n],
+            )
+            conn.execute("COMMIT")
+            commits += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+        except sqlite3.OperationalError:
+            locked += 1
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+    conn.close()
+    results.put((commits, locked, latencies))
+
+
+class Command(BaseCommand):
+    help = "Measure concurrent write throughput of the SQLite connection profiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', choices=sorted(PROFILES))
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+
+    def handle(self, *args, **options):
+        for profile in options['profile'] or ['default', 'performance']:
+            self.run_profile(profile, options['workers'], options['seconds'])
+
+    def run_profile(self, profile, workers, seconds):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'bench.sqlite3')
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE likes (id INTEGER PRIMARY KEY, post_id INTEGER, "
+            "user_id INTEGER, created_at TEXT, UNIQUE (user_id, post_id))"
+        )
+        conn.execute("CREATE INDEX likes_post_idx ON likes (post_id)")
+        conn.commit()
+        conn.close()
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=_writer, args=(path, profile, worker, seconds, results))
+            for worker in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+        commits = sum(outcome[0] for outcome in outcomes)
+        locked = sum(outcome[1] for outcome in outcomes)
+        latencies = sorted(latency for outcome in outcomes for latency in outcome[2])
+        p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+        p50 = statistics.median(latencies) if latencies else 0
+        self.stdout.write(
+            f"{profile:<12} workers={workers} commits/s={commits / seconds:9.1f} "
+            f"locked_errors={locked:6d} p50={p50:7.2f} ms p99={p99:7.2f} ms"
+        )
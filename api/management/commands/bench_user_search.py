@@ -0,0 +1,118 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.search import MEMBER_SEARCH_SCHEMA, phrase
+
+
+SYLLABLES = [
+    'an', 'bel', 'cor', 'dan', 'el', 'fi', 'gor', 'ha', 'is', 'jo', 'ka', 'lin',
+    'mar', 'ni', 'ol', 'pe', 'qui', 'ro', 'sa', 'tin', 'ul', 'va', 'wen', 'xa',
+    'yor', 'zel',
+]
+
+LIKE_COUNT = (
+    "SELECT count(*) FROM members "
+    "WHERE username LIKE ? ESCAPE '\\' OR first_name LIKE ? ESCAPE '\\' OR last_name LIKE ? ESCAPE '\\'"
+)
+LIKE_PAGE = (
+    "SELECT id, username, first_name, last_name FROM members "
+    "WHERE username LIKE ? ESCAPE '\\' OR first_name LIKE ? ESCAPE '\\' OR last_name LIKE ? ESCAPE '\\' "
+    "ORDER BY created_at DESC LIMIT 20"
+)
+FTS_COUNT = "SELECT count(*) FROM members_fts WHERE members_fts MATCH ?"
+FTS_PAGE = "SELECT rowid FROM members_fts WHERE members_fts MATCH ? ORDER BY rank, rowid DESC LIMIT 20"
+
+
+class Command(BaseCommand):
+    help = "Compare LIKE scans with the members_fts trigram index on a synthetic members table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--database', help="SQLite file to build (default: a temporary file)")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        path = options['database'] or os.path.join(tempfile.mkdtemp(), 'bench_user_search.sqlite3')
+        conn = sqlite3.connect(path)
+        try:
+            self.build(conn, options['members'], rng)
+            queries = [self.word(rng)[:rng.randint(3, 5)] for _ in range(options['queries'])]
+            like = self.measure(conn, queries, self.like_search)
+            fts = self.measure(conn, queries, self.fts_search)
+        finally:
+            conn.close()
+            if not options['database']:
+                os.remove(path)
+
+        self.stdout.write(f"{options['members']} members, {len(queries)} queries (count + first page)")
+        for name, timings in (('LIKE scan', like), ('FTS5 trigram', fts)):
+            self.stdout.write(
+                f"  {name:<13} p50={statistics.median(timings):8.2f} ms  "
+                f"p95={self.percentile(timings, 95):8.2f} ms  max={max(timings):8.2f} ms"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Median speedup: {statistics.median(like) / statistics.median(fts):.1f}x"
+        ))
+
+    def word(self, rng):
+        return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+    def build(self, conn, count, rng):
+        started = time.perf_counter()
+        conn.execute(
+            "CREATE TABLE members (id INTEGER PRIMARY KEY, username TEXT UNIQUE, "
+            "first_name TEXT, last_name TEXT, created_at TEXT)"
+        )
+        batch = []
+        for pk in range(1, count + 1):
+            batch.append((
+                pk,
+                f'{self.word(rng)}{pk}',
+                self.word(rng).title(),
+                self.word(rng).title(),
+                f'2024-01-01 00:00:{pk:010d}',
+            ))
+            if len(batch) == 50_000:
+                conn.executemany("INSERT INTO members VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+        conn.executemany("INSERT INTO members VALUES (?, ?, ?, ?, ?)", batch)
+        conn.execute("CREATE INDEX members_created_at_idx ON members (created_at)")
+        for statement in MEMBER_SEARCH_SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        self.stdout.write(f"Built {count} members in {time.perf_counter() - started:.1f}s")
+
+    def like_search(self, conn, query):
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conn.execute(LIKE_COUNT, [pattern] * 3).fetchone()
+        conn.execute(LIKE_PAGE, [pattern] * 3).fetchall()
+
+    def fts_search(self, conn, query):
+        match = phrase(query)
+        conn.execute(FTS_COUNT, [match]).fetchone()
+        ids = [row[0] for row in conn.execute(FTS_PAGE, [match])]
+        if ids:
+            conn.execute(
+                f"SELECT id, username, first_name, last_name FROM members WHERE id IN ({','.join('?' * len(ids))})",
+                ids,
+            ).fetchall()
+
+    def measure(self, conn, queries, search):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            search(conn, query)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def percentile(self, values, pct):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import export
+from api.models import Member
+
+
+class Command(BaseCommand):
+    help = "Stream a member's data export as NDJSON or zip to a file or stdout"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--type', choices=sorted(export.CONTENT_TYPES), default='ndjson')
+        parser.add_argument('--output', help="File to write (default: stdout)")
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            member = Member.objects.get(username=options['username'])
+        except Member.DoesNotExist:
+            raise CommandError(f"No member named {options['username']!r}")
+
+        pieces = export.stream(member, options['type'], options['chunk_size'])
+        if options['output']:
+            written = 0
+            with open(options['output'], 'wb') as fh:
+                for piece in pieces:
+                    fh.write(piece)
+                    written += len(piece)
+            self.stderr.write(f"Wrote {written} bytes to {options['output']}")
+        else:
+            out = getattr(self.stdout, 'buffer', None)
+            if out is None:
+                raise CommandError("stdout does not accept bytes; use --output")
+            for piece in pieces:
+                out.write(piece)
+            out.flush()
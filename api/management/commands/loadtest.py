@@ -0,0 +1,338 @@
+import http.client
+import json
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands.seed_social_graph import SEED_PASSWORD, WORDS
+from api.models import Member, Post
+
+
+DEFAULT_MIX = (
+    'feed=25,posts=15,post=15,comments=10,user=8,user-posts=6,dialogs=5,messages=3,'
+    'user-search=3,post-search=2,new-post=3,new-comment=2,send-message=2,heartbeat=1'
+)
+
+# Latency histogram bucket upper bounds, in milliseconds.
+BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, float('inf')]
+
+
+def word(rng):
+    return rng.choice(WORDS)
+
+
+# label -> builder(rng, client) returning (method, path, body)
+REQUESTS = {
+    'feed': lambda rng, c: ('GET', '/api/feed', None),
+    'posts': lambda rng, c: ('GET', '/api/posts', None),
+    'post': lambda rng, c: ('GET', f'/api/posts/{rng.choice(c.post_ids)}', None),
+    'comments': lambda rng, c: ('GET', f'/api/posts/{rng.choice(c.post_ids)}/comments', None),
+    'user': lambda rng, c: ('GET', f'/api/users/{rng.choice(c.member_ids)}', None),
+    'user-posts': lambda rng, c: ('GET', f'/api/users/{rng.choice(c.member_ids)}/posts', None),
+    'subscribers': lambda rng, c: ('GET', f'/api/users/{rng.choice(c.member_ids)}/subscribers', None),
+    'dialogs': lambda rng, c: ('GET', '/api/dialogs', None),
+    'messages': lambda rng, c: ('GET', f'/api/dialogs/{rng.choice(c.member_ids)}', None),
+    'me': lambda rng, c: ('GET', '/api/auth/me', None),
+    'user-search': lambda rng, c: ('GET', f'/api/users/search?q={word(rng)[:4]}', None),
+    'post-search': lambda rng, c: ('GET', f'/api/posts/search?q={word(rng)}', None),
+    'new-post': lambda rng, c: ('POST', '/api/posts', {'content': f'{word(rng)} {word(rng)} {word(rng)}'}),
+    'new-comment': lambda rng, c: (
+        'POST', f'/api/posts/{rng.choice(c.post_ids)}/comments', {'content': word(rng)},
+    ),
+    'send-message': lambda rng, c: (
+        'POST', f'/api/dialogs/{rng.choice(c.member_ids)}', {'content': word(rng)},
+    ),
+    'heartbeat': lambda rng, c: ('POST', '/api/presence/heartbeat', None),
+}
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        label, _, weight = item.partition('=')
+        label = label.strip()
+        if label not in REQUESTS:
+            raise CommandError(f"Unknown request {label!r}; choose from {', '.join(sorted(REQUESTS))}")
+        try:
+            mix[label] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight in {item!r}")
+    return mix
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Client(threading.Thread):
+    """One closed-loop client: send a request, wait for the response, repeat."""
+
+    def __init__(self, address, token, mix, member_ids, post_ids, seed, think_time):
+        super().__init__(daemon=True)
+        self.address = address
+        self.token = token
+        self.labels = list(mix)
+        self.weights = list(mix.values())
+        self.member_ids = member_ids
+        self.post_ids = post_ids
+        self.rng = random.Random(seed)
+        self.think_time = think_time
+        self.recording = False
+        self.stopped = threading.Event()
+        # label -> latencies in ms, label -> error count
+        self.latencies = {}
+        self.errors = {}
+
+    def run(self):
+        host, port = self.address
+        connection = http.client.HTTPConnection(host, port, timeout=60)
+        while not self.stopped.is_set():
+            label = self.rng.choices(self.labels, self.weights)[0]
+            method, path, body = REQUESTS[label](self.rng, self)
+            headers = {'Authorization': f'Token {self.token}'}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, payload, headers)
+                response = connection.getresponse()
+                response.read()
+                failed = response.status >= 400
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                failed = True
+            elapsed = (time.perf_counter() - started) * 1000
+            if self.recording:
+                self.latencies.setdefault(label, []).append(elapsed)
+                if failed:
+                    self.errors[label] = self.errors.get(label, 0) + 1
+            if self.think_time:
+                time.sleep(self.think_time)
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Start gunicorn with gunicorn.conf.py for each worker class and worker count, drive a "
+        "weighted mix of API requests from concurrent closed-loop clients, and report "
+        "throughput and latency percentiles per endpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker-class', default='sync,gthread', help="Comma-separated worker classes")
+        parser.add_argument('--workers', default='1,2,4', help="Comma-separated worker counts")
+        parser.add_argument('--threads', type=int, default=4, help="Threads per gthread worker")
+        parser.add_argument('--clients', type=int, default=16, help="Concurrent clients")
+        parser.add_argument('--duration', type=float, default=20, help="Measured seconds per configuration")
+        parser.add_argument('--warmup', type=float, default=3, help="Unmeasured seconds before each run")
+        parser.add_argument('--think-time', type=float, default=0, help="Seconds a client waits between requests")
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f"label=weight pairs (default: {DEFAULT_MIX})")
+        parser.add_argument('--password', default=SEED_PASSWORD, help="Password of the members clients log in as")
+        parser.add_argument('--port', type=int, default=8055)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        classes = [name.strip() for name in options['worker_class'].split(',') if name.strip()]
+        counts = [int(count) for count in options['workers'].split(',') if count.strip()]
+        usernames = list(Member.objects.order_by('id').values_list('username', flat=True)[:options['clients']])
+        if len(usernames) < options['clients']:
+            raise CommandError(
+                f"Need {options['clients']} members to log in as, found {len(usernames)}; "
+                "run seed_social_graph first"
+            )
+        member_ids = list(Member.objects.order_by('-id').values_list('id', flat=True)[:5000])
+        post_ids = list(Post.objects.order_by('-id').values_list('id', flat=True)[:5000])
+        if not post_ids:
+            raise CommandError("No posts to request; run seed_social_graph first")
+
+        self.log_dir = Path(tempfile.mkdtemp(prefix='loadtest-'))
+        self.address = ('127.0.0.1', options['port'])
+        tokens = None
+        results = []
+        for worker_class in classes:
+            for workers in counts:
+                with self.server(worker_class, workers, options['threads']):
+                    if tokens is None:
+                        tokens = self.login(usernames, options['password'])
+                    result = self.run(worker_class, workers, tokens, mix, member_ids, post_ids, options)
+                results.append(result)
+                self.print_result(result)
+
+        self.print_summary(results)
+        if options['json']:
+            with open(options['json'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+        self.stdout.write(f"Server logs: {self.log_dir}")
+
+    @contextmanager
+    def server(self, worker_class, workers, threads):
+        """Run gunicorn with the deployment config, overriding only bind and worker settings."""
+        log_path = self.log_dir / f'gunicorn-{worker_class}-{workers}.log'
+        with open(log_path, 'w') as log:
+            process = subprocess.Popen(
+                [
+                    sys.executable, '-m', 'gunicorn',
+                    '--config', str(settings.BASE_DIR / 'gunicorn.conf.py'),
+                    '--bind', '%s:%d' % self.address,
+                    '--workers', str(workers),
+                    '--worker-class', worker_class,
+                    '--threads', str(threads),
+                    'config.wsgi:application',
+                ],
+                cwd=settings.BASE_DIR,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+            try:
+                self.wait_until_ready(process, log_path)
+                yield
+            finally:
+                process.send_signal(signal.SIGTERM)
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+    def wait_until_ready(self, process, log_path):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"gunicorn exited with {process.returncode}, see {log_path}")
+            try:
+                socket.create_connection(self.address, timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        process.kill()
+        raise CommandError(f"gunicorn did not start listening within 30s, see {log_path}")
+
+    def login(self, usernames, password):
+        """Log every client in through LoginView, in parallel since hashing is slow."""
+        tokens = [None] * len(usernames)
+
+        def log_in(index, username):
+            connection = http.client.HTTPConnection(*self.address, timeout=60)
+            connection.request(
+                'POST', '/api/auth/login',
+                json.dumps({'username': username, 'password': password}),
+                {'Content-Type': 'application/json'},
+            )
+            response = connection.getresponse()
+            body = response.read()
+            connection.close()
+            if response.status == 200:
+                tokens[index] = json.loads(body)['token']
+
+        threads = [threading.Thread(target=log_in, args=item) for item in enumerate(usernames)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if None in tokens:
+            failed = [username for username, token in zip(usernames, tokens) if token is None]
+            raise CommandError(f"Login failed for {', '.join(failed[:5])}; check --password")
+        return tokens
+
+    def run(self, worker_class, workers, tokens, mix, member_ids, post_ids, options):
+        clients = [
+            Client(self.address, token, mix, member_ids, post_ids, options['seed'] + index, options['think_time'])
+            for index, token in enumerate(tokens)
+        ]
+        for client in clients:
+            client.start()
+        time.sleep(options['warmup'])
+        for client in clients:
+            client.recording = True
+        started = time.perf_counter()
+        time.sleep(options['duration'])
+        for client in clients:
+            client.recording = False
+        elapsed = time.perf_counter() - started
+        for client in clients:
+            client.stopped.set()
+        for client in clients:
+            client.join()
+
+        endpoints = {}
+        for label in mix:
+            latencies = [value for client in clients for value in client.latencies.get(label, [])]
+            if not latencies:
+                continue
+            endpoints[label] = self.summarize(latencies, elapsed)
+            endpoints[label]['errors'] = sum(client.errors.get(label, 0) for client in clients)
+        everything = [value for client in clients for values in client.latencies.values() for value in values]
+        total = self.summarize(everything, elapsed) if everything else {'requests': 0}
+        total['errors'] = sum(endpoint['errors'] for endpoint in endpoints.values())
+        return {
+            'worker_class': worker_class,
+            'workers': workers,
+            'threads': options['threads'] if worker_class == 'gthread' else 1,
+            'clients': len(clients),
+            'seconds': round(elapsed, 2),
+            'total': total,
+            'endpoints': endpoints,
+        }
+
+    def summarize(self, latencies, elapsed):
+        histogram = [0] * len(BUCKETS)
+        for value in latencies:
+            histogram[next(i for i, bound in enumerate(BUCKETS) if value < bound)] += 1
+        return {
+            'requests': len(latencies),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(max(latencies), 2),
+            'histogram': histogram,
+        }
+
+    def print_result(self, result):
+        threads = f" x {result['threads']} threads" if result['worker_class'] == 'gthread' else ''
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\n{result['worker_class']}, {result['workers']} worker(s){threads}, "
+            f"{result['clients']} clients, {result['seconds']}s"
+        ))
+        bounds = ' '.join(f"{'<' + format(bound, 'g') if bound != float('inf') else '>=1000':>6}" for bound in BUCKETS)
+        self.stdout.write(
+            f"  {'endpoint':<14} {'reqs':>7} {'rps':>8} {'err':>5} {'p50':>8} {'p95':>8} {'p99':>8}   {bounds} ms"
+        )
+        for label, stats in sorted(result['endpoints'].items()) + [('TOTAL', result['total'])]:
+            if not stats['requests']:
+                continue
+            shares = ' '.join(f"{100 * count / stats['requests']:5.1f}%" for count in stats['histogram'])
+            self.stdout.write(
+                f"  {label:<14} {stats['requests']:>7} {stats['rps']:>8} {stats['errors']:>5} "
+                f"{stats['p50']:>8} {stats['p95']:>8} {stats['p99']:>8}   {shares}"
+            )
+
+    def print_summary(self, results):
+        self.stdout.write(self.style.MIGRATE_HEADING("\nSummary"))
+        self.stdout.write(f"  {'configuration':<24} {'rps':>8} {'err':>5} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for result in results:
+            total = result['total']
+            if not total['requests']:
+                continue
+            name = f"{result['worker_class']} w={result['workers']}"
+            if result['worker_class'] == 'gthread':
+                name += f" t={result['threads']}"
+            self.stdout.write(
+                f"  {name:<24} {total['rps']:>8} {total['errors']:>5} "
+                f"{total['p50']:>8} {total['p95']:>8} {total['p99']:>8}"
+            )
@@ -0,0 +1,210 @@
+import json
+import platform
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api import rows, signed_tokens
+from api.authentication import TokenAuthentication
+from api.models import Member, Message, Post
+from api.pagination import StandardResultsSetPagination
+from api.serializers import MemberSerializer, MessageSerializer, PostSerializer
+from api.tokens import Token
+
+
+class Fixture:
+    """Objects the benchmarks work on, loaded once so timings exclude fetching them."""
+
+    def __init__(self):
+        factory = APIRequestFactory()
+        self.member = Member.objects.order_by('-followers_count', 'id').first()
+        self.posts = list(Post.objects.for_listing(self.member).order_by('-created_at', '-id')[:20])
+        self.messages = list(Message.objects.order_by('-created_at', '-id')[:50])
+        # The same pages as values() rows, for the serializer fast path.
+        self.post_rows = list(
+            Post.objects.for_listing(self.member).order_by('-created_at', '-id').values(*rows.POST)[:20]
+        )
+        self.message_rows = list(Message.objects.order_by('-created_at', '-id').values(*rows.MESSAGE)[:50])
+        self.request = Request(factory.get('/api/posts'))
+        self.request.user = self.member
+        self.page_request = Request(factory.get('/api/posts', {'page': 2}))
+        opaque = Token.objects.create(user=self.member)
+        self.opaque_request = Request(factory.get('/', HTTP_AUTHORIZATION=f'Token {opaque.key}'))
+        signed = signed_tokens.issue(self.member)
+        self.signed_request = Request(factory.get('/', HTTP_AUTHORIZATION=f'Token {signed}'))
+        self.post_page = PostSerializer(self.posts, many=True, context={'request': self.request}).data
+
+
+def post_serializer_page(fixture):
+    return PostSerializer(fixture.posts, many=True, context={'request': fixture.request}).data
+
+
+def post_rows_page(fixture):
+    return rows.posts(fixture.post_rows, fixture.request)
+
+
+def member_serializer(fixture):
+    return MemberSerializer(fixture.member).data
+
+
+def message_serializer_page(fixture):
+    return MessageSerializer(fixture.messages, many=True).data
+
+
+def message_rows_page(fixture):
+    return rows.messages(fixture.message_rows)
+
+
+def authenticate_opaque_token(fixture):
+    return TokenAuthentication().authenticate(fixture.opaque_request)
+
+
+def authenticate_signed_token(fixture):
+    return TokenAuthentication().authenticate(fixture.signed_request)
+
+
+def standard_pagination(fixture):
+    paginator = StandardResultsSetPagination()
+    page = paginator.paginate_queryset(Post.objects.order_by('-created_at'), fixture.page_request)
+    return paginator.get_paginated_response([post.id for post in page])
+
+
+def json_render_post_page(fixture):
+    return JSONRenderer().render(fixture.post_page)
+
+
+BENCHMARKS = [
+    post_serializer_page,
+    post_rows_page,
+    member_serializer,
+    message_serializer_page,
+    message_rows_page,
+    authenticate_opaque_token,
+    authenticate_signed_token,
+    standard_pagination,
+    json_render_post_page,
+]
+
+
+def measure(benchmarks, fixture, number, repeat):
+    """
+    Best per-call time in microseconds of each benchmark over ``repeat``
+    runs of ``number`` calls. Runs are interleaved across benchmarks so a
+    slow patch on a shared machine hits all of them rather than one.
+    """
+    best = {benchmark.__name__: float('inf') for benchmark in benchmarks}
+    for benchmark in benchmarks:
+        for _ in range(number):
+            benchmark(fixture)
+    for _ in range(repeat):
+        for benchmark in benchmarks:
+            started = time.perf_counter()
+            for _ in range(number):
+                benchmark(fixture)
+            elapsed = (time.perf_counter() - started) / number
+            best[benchmark.__name__] = min(best[benchmark.__name__], elapsed)
+    return {name: value * 1_000_000 for name, value in best.items()}
+
+
+def compare(baseline, results, threshold):
+    """
+    ``(name, baseline_us, current_us, change)`` for every benchmark that got
+    slower than its baseline by more than ``threshold`` (0.1 = 10%).
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous:
+            change = current / previous - 1
+            if change > threshold:
+                regressions.append((name, previous, current, change))
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Time serializers, token authentication, pagination and JSON rendering against an "
+        "in-memory SQLite fixture and compare the results with a stored baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline',
+            default=str(settings.BASE_DIR / 'microbench-baseline.json'),
+            help="Baseline file to compare with (and to write with --save)",
+        )
+        parser.add_argument('--save', action='store_true', help="Store this run as the new baseline")
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.15,
+            help="Fail when a benchmark is this much slower than the baseline (0.15 = 15%%)",
+        )
+        parser.add_argument('--number', type=int, default=100, help="Calls per timing run")
+        parser.add_argument('--repeat', type=int, default=10, help="Timing runs per benchmark; the best is kept")
+        parser.add_argument('--members', type=int, default=300, help="Size of the seeded fixture")
+        parser.add_argument('--only', action='append', help="Run only this benchmark (may be repeated)")
+
+    def handle(self, *args, **options):
+        names = [benchmark.__name__ for benchmark in BENCHMARKS]
+        for name in options['only'] or []:
+            if name not in names:
+                raise CommandError(f"Unknown benchmark {name!r}; choose from {', '.join(names)}")
+        selected = [b for b in BENCHMARKS if not options['only'] or b.__name__ in options['only']]
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command(
+                'seed_social_graph', members=options['members'], seed=1, no_timelines=True,
+                stdout=StringIO(),
+            )
+            fixture = Fixture()
+            results = measure(selected, fixture, options['number'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        baseline = {}
+        try:
+            with open(options['baseline']) as fh:
+                baseline = json.load(fh)['results']
+        except FileNotFoundError:
+            pass
+
+        self.stdout.write(f"  {'benchmark':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if previous:
+                line = f"  {name:<28} {previous:>10.1f}us {current:>10.1f}us {current / previous - 1:>+8.1%}"
+            else:
+                line = f"  {name:<28} {'-':>12} {current:>10.1f}us {'':>8}"
+            self.stdout.write(line)
+
+        if options['save']:
+            with open(options['baseline'], 'w') as fh:
+                json.dump({
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'number': options['number'],
+                    'repeat': options['repeat'],
+                    'results': {name: round(value, 2) for name, value in results.items()},
+                }, fh, indent=2)
+                fh.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {options['baseline']}"))
+            return
+
+        regressions = compare(baseline, results, options['threshold'])
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} benchmark(s) regressed by more than {options['threshold']:.0%}: "
+                + ', '.join(f"{name} {change:+.1%}" for name, _, _, change in regressions)
+            )
+        if baseline:
+            self.stdout.write(self.style.SUCCESS(f"No regression above {options['threshold']:.0%}"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api import images
+
+
+class Command(BaseCommand):
+    help = "Generate resized variants for post images and avatars uploaded before they existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help="Regenerate variants for every image, not only those without any",
+        )
+
+    def handle(self, *args, **options):
+        for (model, field), sizes in images.VARIANTS.items():
+            queryset = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            if not options['all']:
+                queryset = queryset.filter(**{f'{field}_variants': {}})
+
+            done = failed = 0
+            for pk in queryset.order_by('pk').values_list('pk', flat=True).iterator():
+                if images.process(model, pk, field):
+                    done += 1
+                else:
+                    failed += 1
+            self.stdout.write(f"{model._meta.db_table}.{field}: {done} processed, {failed} skipped")
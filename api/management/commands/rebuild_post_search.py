@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the posts_fts full-text index from the posts table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--optimize',
+            action='store_true',
+            help="Merge index segments after rebuilding",
+        )
+
+    def handle(self, *args, **options):
+        if not search.fts_available(search.POST_SEARCH_TABLE):
+            raise CommandError("posts_fts is not available on this database")
+
+        with transaction.atomic():
+            search.rebuild(search.POST_SEARCH_TABLE)
+        if options['optimize']:
+            search.optimize(search.POST_SEARCH_TABLE)
+
+        self.stdout.write(self.style.SUCCESS("Rebuilt post search index"))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+
+from api.counters import COUNTERS, reconcile
+from api.models import Member, Post
+
+
+MODELS = {
+    'posts': Post,
+    'members': Member,
+}
+
+
+class Command(BaseCommand):
+    help = "Verify denormalized post and member counters and repair any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            choices=sorted(MODELS),
+            action='append',
+            help="Limit the check to one table (may be repeated)",
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report drifted counters without rewriting them",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        repair = not options['dry_run']
+
+        for name in options['model'] or sorted(MODELS):
+            model = MODELS[name]
+            bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+            if bounds['low'] is None:
+                continue
+
+            drifted = 0
+            for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+                with transaction.atomic():
+                    drift = reconcile(model, start, start + chunk_size, repair=repair)
+                for pk, field, stored, actual in drift:
+                    self.stdout.write(f"{name} {pk} {field}: stored={stored} actual={actual}")
+                drifted += len(drift)
+
+            verb = "Found" if options['dry_run'] else "Repaired"
+            self.stdout.write(self.style.SUCCESS(
+                f"{verb} {drifted} drifted counter(s) in {name} "
+                f"({', '.join(COUNTERS[model])})"
+            ))
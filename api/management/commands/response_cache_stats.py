@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import response_cache
+
+
+class Command(BaseCommand):
+    help = "Report hit and miss totals of the anonymous post listing cache"
+
+    def handle(self, *args, **options):
+        for name, summary in response_cache.totals(response_cache.LISTINGS).items():
+            ratio = summary['hit_ratio']
+            self.stdout.write(
+                f"{name}: hits={summary['hits']} misses={summary['misses']} "
+                f"hit_ratio={'-' if ratio is None else f'{ratio:.1%}'}"
+            )
@@ -0,0 +1,414 @@
+import itertools
+import random
+import time
+from array import array
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.feed import fanout_threshold
+from api.models import Comment, Conversation, Like, Member, Message, Post, Subscription, TimelineEntry
+
+
+WORDS = [
+    'coffee', 'morning', 'run', 'city', 'river', 'music', 'concert', 'book', 'garden', 'rain',
+    'weekend', 'project', 'launch', 'team', 'dinner', 'recipe', 'photo', 'sunset', 'trip', 'train',
+    'mountain', 'beach', 'game', 'match', 'goal', 'idea', 'draft', 'release', 'bug', 'fix',
+    'movie', 'series', 'episode', 'podcast', 'class', 'lecture', 'exam', 'friend', 'family', 'dog',
+    'cat', 'bike', 'market', 'bread', 'tea', 'snow', 'summer', 'winter', 'light', 'night',
+]
+FIRST_NAMES = [
+    'Anna', 'Boris', 'Clara', 'Dmitri', 'Elena', 'Felix', 'Greta', 'Hugo', 'Irina', 'Jonas',
+    'Katya', 'Leon', 'Maria', 'Nikita', 'Olga', 'Pavel', 'Quinn', 'Rosa', 'Sergei', 'Tanya',
+    'Ulrich', 'Vera', 'Wanda', 'Xenia', 'Yuri', 'Zoe',
+]
+LAST_NAMES = [
+    'Ivanova', 'Petrov', 'Smirnova', 'Kuznetsov', 'Popova', 'Sokolov', 'Lebedeva', 'Kozlov',
+    'Novikova', 'Morozov', 'Volkova', 'Solovyov', 'Vasilyeva', 'Zaitsev', 'Pavlova', 'Semenov',
+    'Golubeva', 'Vinogradov', 'Bogdanova', 'Vorobyov', 'Fedorova', 'Mikhailov', 'Belyaeva',
+]
+
+SEED_PASSWORD = 'password123'
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at values we generate instead of now()."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill an empty database with a deterministic synthetic social graph: members, "
+        "a power-law follow graph, posts, likes, comments and dialogs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=10_000)
+        parser.add_argument('--follows', type=float, default=20, help="Mean follows per member")
+        parser.add_argument('--posts', type=float, default=5, help="Mean posts per member")
+        parser.add_argument('--likes', type=float, default=20, help="Mean likes given per member")
+        parser.add_argument('--comments', type=float, default=5, help="Mean comments written per member")
+        parser.add_argument('--dialogs', type=float, default=2, help="Mean dialogs started per member")
+        parser.add_argument('--messages', type=float, default=8, help="Mean messages per dialog")
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.0,
+            help="Zipf exponent of member popularity; higher concentrates followers and likes",
+        )
+        parser.add_argument('--days', type=int, default=365, help="Length of the simulated history")
+        parser.add_argument('--start', default='2024-01-01', help="First day of the simulated history")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-timelines',
+            action='store_true',
+            help="Skip fanning posts out into timeline_entries",
+        )
+
+    def handle(self, *args, **options):
+        if Member.objects.exists():
+            raise CommandError("The members table is not empty; seed a fresh database")
+        if options['members'] < 2:
+            raise CommandError("--members must be at least 2")
+
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.chunk_size = options['chunk_size']
+        self.start = datetime.fromisoformat(options['start']).replace(tzinfo=dt_timezone.utc)
+        self.window = options['days'] * 86400.0
+        started = time.perf_counter()
+
+        self.plan_members()
+        self.plan_follows()
+        self.plan_posts()
+        self.plan_likes()
+        self.plan_comments()
+        self.stdout.write(f"Planned graph in {time.perf_counter() - started:.1f}s")
+
+        with explicit_timestamps(Member, Post, Message):
+            self.write_members()
+            self.write_posts()
+            self.write_follows()
+            self.write_likes()
+            self.write_comments()
+            self.write_dialogs()
+        if not options['no_timelines']:
+            self.write_timelines()
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {options['members']} members in {time.perf_counter() - started:.1f}s"
+        ))
+
+    # Planning happens in index space with compact arrays, so counters are
+    # known before rows are written and no reconcile pass is needed.
+
+    def at(self, offset):
+        return self.start + timedelta(seconds=offset)
+
+    def after(self, offset):
+        """A random moment between ``offset`` and the end of the window."""
+        return offset + self.rng.random() * (self.window - offset)
+
+    def weighted(self, cumulative):
+        return bisect(cumulative, self.rng.random() * cumulative[-1])
+
+    def plan_members(self):
+        n = self.options['members']
+        rng = self.rng
+        # Members join over the first half of the history.
+        self.member_created = array('d', sorted(rng.random() * self.window / 2 for _ in range(n)))
+        ranks = list(range(n))
+        rng.shuffle(ranks)
+        skew = self.options['skew']
+        self.popularity = array('d', (1.0 / (rank + 1) ** skew for rank in ranks))
+        self.popularity_cumulative = array('d', itertools.accumulate(self.popularity))
+        # Heavy-tailed activity: most members are quiet, a few post and follow a lot.
+        self.activity = array('d', (rng.paretovariate(1.5) for _ in range(n)))
+        self.activity_cumulative = array('d', itertools.accumulate(self.activity))
+        self.mean_activity = self.activity_cumulative[-1] / n
+        self.followers_count = array('l', [0]) * n
+        self.following_count = array('l', [0]) * n
+        self.posts_count = array('l', [0]) * n
+
+    def plan_follows(self):
+        n = self.options['members']
+        cap = max(1, min(n - 1, 5000))
+        self.follow_subscriber = array('l')
+        self.follow_target = array('l')
+        self.follow_created = array('d')
+        for member in range(n):
+            wanted = min(cap, round(self.options['follows'] * self.activity[member] / self.mean_activity))
+            targets = set()
+            for _ in range(wanted * 3):
+                if len(targets) >= wanted:
+                    break
+                target = self.weighted(self.popularity_cumulative)
+                if target != member:
+                    targets.add(target)
+            for target in sorted(targets):
+                joined = max(self.member_created[member], self.member_created[target])
+                self.follow_subscriber.append(member)
+                self.follow_target.append(target)
+                self.follow_created.append(self.after(joined))
+                self.followers_count[target] += 1
+            self.following_count[member] = len(targets)
+
+    def plan_posts(self):
+        n = self.options['members']
+        total = round(n * self.options['posts'])
+        self.post_author = array('l')
+        self.post_created = array('d')
+        for _ in range(total):
+            author = self.weighted(self.activity_cumulative)
+            self.post_author.append(author)
+            self.post_created.append(self.after(self.member_created[author]))
+            self.posts_count[author] += 1
+        # Posts by popular authors draw most of the engagement.
+        self.post_cumulative = array('d', itertools.accumulate(
+            self.popularity[author] for author in self.post_author
+        ))
+        self.likes_count = array('l', [0]) * total
+        self.comments_count = array('l', [0]) * total
+
+    def plan_likes(self):
+        self.like_user = array('l')
+        self.like_post = array('l')
+        self.like_created = array('d')
+        if not self.post_author:
+            return
+        posts = len(self.post_author)
+        for member in range(self.options['members']):
+            wanted = min(posts, round(self.options['likes'] * self.activity[member] / self.mean_activity))
+            liked = set()
+            for _ in range(wanted * 3):
+                if len(liked) >= wanted:
+                    break
+                liked.add(self.weighted(self.post_cumulative))
+            for post in sorted(liked):
+                self.like_user.append(member)
+                self.like_post.append(post)
+                self.like_created.append(self.after(max(self.member_created[member], self.post_created[post])))
+                self.likes_count[post] += 1
+
+    def plan_comments(self):
+        self.comment_author = array('l')
+        self.comment_post = array('l')
+        self.comment_created = array('d')
+        if not self.post_author:
+            return
+        total = round(self.options['members'] * self.options['comments'])
+        for _ in range(total):
+            author = self.weighted(self.activity_cumulative)
+            post = self.weighted(self.post_cumulative)
+            self.comment_author.append(author)
+            self.comment_post.append(post)
+            self.comment_created.append(self.after(max(self.member_created[author], self.post_created[post])))
+            self.comments_count[post] += 1
+
+    def sentence(self, low=3, high=12):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(low, high))).capitalize()
+
+    def report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(f"  {label:<17} {count:>10} rows  {elapsed:7.1f}s  {rate:10.0f} rows/s")
+
+    # Writing: one transaction per table, chunked bulk_create inside it.
+
+    def write_members(self):
+        started = time.perf_counter()
+        rng = self.rng
+        password_hash = make_password(SEED_PASSWORD)
+        self.member_ids = array('l')
+
+        def rows():
+            for i in range(self.options['members']):
+                yield Member(
+                    username=f'user{i}',
+                    email=f'user{i}@example.com',
+                    password_hash=password_hash,
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAMES),
+                    bio=self.sentence(0, 8),
+                    followers_count=self.followers_count[i],
+                    following_count=self.following_count[i],
+                    posts_count=self.posts_count[i],
+                    created_at=self.at(self.member_created[i]),
+                )
+
+        with transaction.atomic():
+            for chunk in chunked(rows(), self.chunk_size):
+                self.member_ids.extend(member.pk for member in Member.objects.bulk_create(chunk))
+        self.report('members', len(self.member_ids), started)
+
+    def write_posts(self):
+        started = time.perf_counter()
+        ids = self.member_ids
+        self.post_ids = array('l')
+
+        def rows():
+            for i, author in enumerate(self.post_author):
+                yield Post(
+                    author_id=ids[author],
+                    content=self.sentence(),
+                    likes_count=self.likes_count[i],
+                    comments_count=self.comments_count[i],
+                    created_at=self.at(self.post_created[i]),
+                )
+
+        with transaction.atomic():
+            for chunk in chunked(rows(), self.chunk_size):
+                self.post_ids.extend(post.pk for post in Post.objects.bulk_create(chunk))
+        self.report('posts', len(self.post_ids), started)
+
+    def stamp(self, offset):
+        return connection.ops.adapt_datetimefield_value(self.at(offset))
+
+    def write_rows(self, label, model, fields, rows):
+        """
+        Insert plain value tuples into a link table with executemany.
+
+        Model instances cost more to build and bind than SQLite takes to
+        store these rows, so tables whose ids are never needed skip the ORM.
+        """
+        started = time.perf_counter()
+        columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        sql = f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+        written = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            for chunk in chunked(rows, self.chunk_size):
+                cursor.executemany(sql, chunk)
+                written += len(chunk)
+        self.report(label, written, started)
+
+    def write_follows(self):
+        ids = self.member_ids
+        self.write_rows('subscriptions', Subscription, ['subscriber', 'target', 'created_at'], (
+            (ids[subscriber], ids[target], self.stamp(created))
+            for subscriber, target, created in zip(self.follow_subscriber, self.follow_target, self.follow_created)
+        ))
+
+    def write_likes(self):
+        self.write_rows('likes', Like, ['user', 'post', 'created_at'], (
+            (self.member_ids[user], self.post_ids[post], self.stamp(created))
+            for user, post, created in zip(self.like_user, self.like_post, self.like_created)
+        ))
+
+    def write_comments(self):
+        self.write_rows('comments', Comment, ['author', 'post', 'content', 'created_at'], (
+            (self.member_ids[author], self.post_ids[post], self.sentence(1, 8), self.stamp(created))
+            for author, post, created in zip(self.comment_author, self.comment_post, self.comment_created)
+        ))
+
+    def plan_dialog(self, first, second):
+        """Messages of one dialog as (sender, receiver, offset, is_read)."""
+        rng = self.rng
+        count = 1 + int(rng.expovariate(1 / max(self.options['messages'] - 1, 0.01)))
+        offset = self.after(max(self.member_created[first], self.member_created[second]))
+        sender, receiver = first, second
+        messages = []
+        for _ in range(count):
+            messages.append([sender, receiver, min(offset, self.window), True])
+            offset += rng.expovariate(1 / 3600)
+            if rng.random() < 0.5:
+                sender, receiver = receiver, sender
+        # The receiver has read everything up to the last reply.
+        for message in reversed(messages):
+            if message[0] != messages[-1][0]:
+                break
+            message[3] = False
+        return messages
+
+    def write_dialogs(self):
+        started = time.perf_counter()
+        n = self.options['members']
+        total = round(n * self.options['dialogs'])
+        pairs = set()
+        for _ in range(total * 3):
+            if len(pairs) >= total:
+                break
+            first = self.weighted(self.activity_cumulative)
+            second = self.weighted(self.popularity_cumulative)
+            if first != second and (second, first) not in pairs:
+                pairs.add((first, second))
+
+        ids = self.member_ids
+        written = 0
+        with transaction.atomic():
+            for chunk in chunked(sorted(pairs), max(1, self.chunk_size // 10)):
+                dialogs = [self.plan_dialog(first, second) for first, second in chunk]
+                messages = Message.objects.bulk_create([
+                    Message(
+                        sender_id=ids[sender],
+                        receiver_id=ids[receiver],
+                        content=self.sentence(1, 10),
+                        is_read=is_read,
+                        created_at=self.at(offset),
+                    )
+                    for dialog in dialogs for sender, receiver, offset, is_read in dialog
+                ], batch_size=self.chunk_size)
+                written += len(messages)
+
+                rows = []
+                position = 0
+                for (first, second), dialog in zip(chunk, dialogs):
+                    position += len(dialog)
+                    last = messages[position - 1]
+                    unread = sum(1 for message in dialog if not message[3])
+                    for owner, participant in ((first, second), (second, first)):
+                        rows.append(Conversation(
+                            owner_id=ids[owner],
+                            participant_id=ids[participant],
+                            last_message=last,
+                            last_message_at=last.created_at,
+                            unread_count=unread if ids[owner] == last.receiver_id else 0,
+                        ))
+                Conversation.objects.bulk_create(rows)
+        self.report('messages', written, started)
+
+    def write_timelines(self):
+        """
+        Push every post of a fanned-out author into each follower's timeline,
+        as api.feed does on write. Authors at or above the fan-out threshold
+        are left to the read-time merge.
+        """
+        threshold = fanout_threshold()
+        followers = [[] for _ in range(self.options['members'])]
+        for subscriber, target in zip(self.follow_subscriber, self.follow_target):
+            if self.followers_count[target] < threshold:
+                followers[target].append(subscriber)
+
+        member_ids, post_ids = self.member_ids, self.post_ids
+
+        def rows():
+            for i, author in enumerate(self.post_author):
+                created_at = self.stamp(self.post_created[i])
+                for follower in followers[author]:
+                    yield member_ids[follower], post_ids[i], member_ids[author], created_at
+
+        self.write_rows('timeline entries', TimelineEntry, ['owner', 'post', 'author', 'created_at'], rows())
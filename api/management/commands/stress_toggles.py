@@ -0,0 +1,168 @@
+import random
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.counters import reconcile
+from api.models import Like, Member, Post, Subscription
+from api.views import LikeView, SubscribeView
+
+
+# (view, method, path pattern, statuses the toggle may answer with)
+ACTIONS = {
+    'like': (LikeView, 'post', '/api/posts/{}/like', {201, 400}),
+    'unlike': (LikeView, 'delete', '/api/posts/{}/like', {200, 400}),
+    'subscribe': (SubscribeView, 'post', '/api/users/{}/subscribe', {201, 400}),
+    'unsubscribe': (SubscribeView, 'delete', '/api/users/{}/subscribe', {200, 404}),
+}
+APPLIED = {'like': 201, 'unlike': 200, 'subscribe': 201, 'unsubscribe': 200}
+TOGGLED_COUNTERS = {'likes_count', 'followers_count', 'following_count'}
+
+
+def _state(members, post_ids, target_ids):
+    member_ids = [member.id for member in members]
+    liked = set(Like.objects.filter(user_id__in=member_ids, post_id__in=post_ids).values_list('user_id', 'post_id'))
+    subscribed = set(
+        Subscription.objects.filter(subscriber_id__in=member_ids, target_id__in=target_ids)
+        .values_list('subscriber_id', 'target_id')
+    )
+    return liked, subscribed
+
+
+def run(members, post_ids, target_ids, threads=8, seconds=5.0, seed=1):
+    """
+    Toggle likes of ``post_ids`` and subscriptions to ``target_ids`` from
+    ``threads`` threads for ``seconds``, thread ``i`` acting as
+    ``members[i % len(members)]`` so several threads race on the same rows.
+    Every request goes through the real views. Returns counts, latencies
+    and the consistency problems found afterwards (empty when correct).
+    """
+    factory = APIRequestFactory()
+    views = {view: view.as_view() for view, *_ in ACTIONS.values()}
+    liked_before, subscribed_before = _state(members, post_ids, target_ids)
+    deadline = time.monotonic() + seconds
+    lock = threading.Lock()
+    applied = {}  # (action, member id, object id) -> successful requests
+    unexpected, latencies = [], []
+    locked = [0]
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        member = members[index % len(members)]
+        own = []
+        try:
+            while time.monotonic() < deadline:
+                action = rng.choice(list(ACTIONS))
+                view, method, path, statuses = ACTIONS[action]
+                choices = post_ids if view is LikeView else [pk for pk in target_ids if pk != member.id]
+                object_id = rng.choice(choices)
+                request = getattr(factory, method)(path.format(object_id))
+                force_authenticate(request, user=member)
+                started = time.perf_counter()
+                try:
+                    response = views[view](request, id=object_id)
+                except OperationalError as error:
+                    # SQLite's lock contention, not a toggle failure.
+                    if 'locked' not in str(error):
+                        raise
+                    with lock:
+                        locked[0] += 1
+                    continue
+                except Exception as error:
+                    with lock:
+                        unexpected.append(f'{action} {object_id}: {error!r}')
+                    continue
+                own.append((time.perf_counter() - started) * 1000)
+                with lock:
+                    if response.status_code not in statuses:
+                        unexpected.append(f'{action} {object_id}: {response.status_code} {response.data}')
+                    elif response.status_code == APPLIED[action]:
+                        key = (action, member.id, object_id)
+                        applied[key] = applied.get(key, 0) + 1
+        finally:
+            with lock:
+                latencies.extend(own)
+            close_old_connections()
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    problems = list(unexpected)
+    liked_after, subscribed_after = _state(members, post_ids, target_ids)
+    # Applied toggles of each row must add up to its change: a like that
+    # reported success but was not stored (or the reverse) shows up here.
+    for member in members:
+        for action, undo, pks, before, after in (
+            ('like', 'unlike', post_ids, liked_before, liked_after),
+            ('subscribe', 'unsubscribe', target_ids, subscribed_before, subscribed_after),
+        ):
+            for pk in pks:
+                net = applied.get((action, member.id, pk), 0) - applied.get((undo, member.id, pk), 0)
+                change = ((member.id, pk) in after) - ((member.id, pk) in before)
+                if net != change:
+                    problems.append(f'{action} {member.id}->{pk}: {net} applied, row changed by {change}')
+    member_ids = [member.id for member in members] + list(target_ids)
+    for model, pks in ((Post, post_ids), (Member, member_ids)):
+        for pk in set(pks):
+            problems.extend(
+                f'{model.__name__} {pk} {field}: stored {stored}, actual {actual}'
+                for _, field, stored, actual in reconcile(model, pk, pk + 1, repair=False)
+                if field in TOGGLED_COUNTERS
+            )
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'applied': sum(applied.values()),
+        'locked': locked[0],
+        'seconds': elapsed,
+        'toggles_per_second': len(latencies) / elapsed if elapsed else 0,
+        'p50': statistics.median(latencies) if latencies else 0,
+        'p99': latencies[int(len(latencies) * 0.99)] if latencies else 0,
+        'problems': problems,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Toggle likes and subscriptions of a few hot posts and members from concurrent threads, "
+        "check that every response and counter is consistent, and report toggle throughput"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--members', type=int, default=2, help="Members the threads act as; fewer means more races")
+        parser.add_argument('--posts', type=int, default=3, help="Hot posts to like and unlike")
+        parser.add_argument('--targets', type=int, default=3, help="Hot members to subscribe to")
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        members = list(Member.objects.order_by('id')[:options['members']])
+        post_ids = list(Post.objects.order_by('-likes_count', 'id').values_list('id', flat=True)[:options['posts']])
+        target_ids = list(
+            Member.objects.order_by('-followers_count', 'id').values_list('id', flat=True)[:options['targets']]
+        )
+        if len(members) < options['members'] or not post_ids or len(target_ids) < 2:
+            raise CommandError("Not enough members or posts to toggle; run seed_social_graph first")
+
+        result = run(members, post_ids, target_ids, options['threads'], options['seconds'], options['seed'])
+        self.stdout.write(
+            f"threads={options['threads']} members={len(members)} requests={result['requests']} "
+            f"applied={result['applied']} toggles/s={result['toggles_per_second']:.1f} "
+            f"p50={result['p50']:.2f} ms p99={result['p99']:.2f} ms locked={result['locked']}"
+        )
+        for problem in result['problems']:
+            self.stderr.write(problem)
+        if result['problems']:
+            raise CommandError(f"{len(result['problems'])} consistency problem(s)")
+        self.stdout.write(self.style.SUCCESS("Responses, rows and counters are consistent"))
@@ -0,0 +1,158 @@
+"""
+Per-request query and timing metrics.
+
+``RequestMetricsMiddleware`` (api.middleware) opens a ``RequestMetrics`` for
+each request. SQL statements are counted and timed through a database
+execute wrapper, and serializers that mix in ``TimedSerializerMixin`` (or
+code wrapped in ``serializing``) add the time spent turning instances into
+primitives. The totals are reported as ``Server-Timing`` and ``X-Query-*``
+response headers, which the gunicorn access log picks up. Periodic upkeep
+that happens to run inside a request (wrapped in ``housekeeping``) is
+counted too, but not towards the view's query budget.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Transaction control is not a query the view asked for.
+_UNCOUNTED_PREFIXES = ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.queries = 0
+        self.housekeeping_queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self._serialize_depth = 0
+        self._housekeeping_depth = 0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            if not sql.lstrip()[:9].upper().startswith(_UNCOUNTED_PREFIXES):
+                self.queries += 1
+                if self._housekeeping_depth:
+                    self.housekeeping_queries += 1
+
+    @property
+    def budgeted_queries(self):
+        """Queries the view is accountable for: all of them except housekeeping."""
+        return self.queries - self.housekeeping_queries
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    @property
+    def app_time(self):
+        """Time outside SQL and serialization: auth, view logic, rendering."""
+        return max(self.total - self.sql_time - self.serialize_time, 0.0)
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'app;dur={self.app_time * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ])
+
+    def headers(self):
+        return {
+            'Server-Timing': self.server_timing(),
+            'X-Query-Count': str(self.queries),
+            'X-Query-Time-Ms': f'{self.sql_time * 1000:.1f}',
+            'X-Serialize-Time-Ms': f'{self.serialize_time * 1000:.1f}',
+        }
+
+
+@contextmanager
+def collect():
+    """Collect metrics for the duration of the block into a new ``RequestMetrics``."""
+    metrics = RequestMetrics()
+    reset = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        metrics.finish()
+        _current.reset(reset)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def housekeeping():
+    """
+    Run periodic per-process upkeep (cache refreshes, buffered writes) that
+    only some requests pay for; its queries do not count against budgets.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    metrics._housekeeping_depth += 1
+    try:
+        yield
+    finally:
+        metrics._housekeeping_depth -= 1
+
+
+class TimedSerializerMixin:
+    """
+    Count ``to_representation`` time towards the request's serialize timing.
+
+    Nested serializers are timed once, by the outermost one. Queries a
+    serializer triggers while rendering (lazy relations) are included in
+    both the serialize and the db figures.
+    """
+
+    def to_representation(self, instance):
+        metrics = _current.get()
+        if metrics is None or metrics._serialize_depth:
+            return super().to_representation(instance)
+        metrics._serialize_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serialize_time += time.perf_counter() - started
+            metrics._serialize_depth -= 1
+
+
+@contextmanager
+def serializing():
+    """Count the block towards the request's serialize timing, like ``TimedSerializerMixin``."""
+    metrics = _current.get()
+    if metrics is None or metrics._serialize_depth:
+        yield
+        return
+    metrics._serialize_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_time += time.perf_counter() - started
+        metrics._serialize_depth -= 1
+
+
+def query_budget(view_class, method):
+    """
+    The number of queries a view may run for ``method``.
+
+    Views declare ``query_budget`` as an int for every method or as a dict
+    keyed by lowercase method name; ``None`` means no budget. Budgets cover
+    the steady state: queries run under ``housekeeping`` (the signed-token
+    revocation filter refresh, presence flushes) are not held against them.
+    """
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(method.lower())
+    return budget
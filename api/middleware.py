@@ -0,0 +1,74 @@
+import logging
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from api import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Count and time the SQL of every request and report it in response headers.
+
+    Emits ``Server-Timing`` for browser and proxy tooling and ``X-Query-Count``,
+    ``X-Query-Time-Ms`` and ``X-Serialize-Time-Ms`` for the access log (see
+    gunicorn.conf.py). Requests that run more queries than their view's
+    ``query_budget``, not counting housekeeping, are logged as warnings.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Under ASGI a sync-only middleware would push every request, long
+        # polls included, onto a worker thread.
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            return self.get_response(request)
+
+        with self.collect() as collected:
+            response = self.get_response(request)
+        return self.report(request, response, collected)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            return await self.get_response(request)
+
+        with self.collect() as collected:
+            response = await self.get_response(request)
+        return self.report(request, response, collected)
+
+    @contextmanager
+    def collect(self):
+        with metrics.collect() as collected, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collected.execute_wrapper))
+            yield collected
+
+    def report(self, request, response, collected):
+        for header, value in collected.headers().items():
+            response[header] = value
+
+        view_class = getattr(request, '_metrics_view_class', None)
+        budget = metrics.query_budget(view_class, request.method)
+        if budget is not None and collected.budgeted_queries > budget:
+            logger.warning(
+                '%s %s ran %d queries, over its budget of %d',
+                request.method, request.path, collected.budgeted_queries, budget,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view_class = getattr(view_func, 'view_class', None)
+        return None
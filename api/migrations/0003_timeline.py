@@ -0,0 +1,72 @@
+# Generated migration
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_timelines(apps, schema_editor):
+    """
+    Copy each followed author's recent posts into the subscriber's timeline.
+    Authors at or above FEED_FANOUT_THRESHOLD followers are merged in at
+    read time and are skipped, as in ``feed.backfill``.
+    """
+    Post = apps.get_model('api', 'Post')
+    Subscription = apps.get_model('api', 'Subscription')
+    TimelineEntry = apps.get_model('api', 'TimelineEntry')
+    threshold = getattr(settings, 'FEED_FANOUT_THRESHOLD', 10000)
+    limit = getattr(settings, 'FEED_BACKFILL_LIMIT', 100)
+    batch_size = getattr(settings, 'FEED_FANOUT_BATCH_SIZE', 1000)
+
+    # Counted from the source table: the followers_count column comes later.
+    followers = {
+        row['target_id']: row['total']
+        for row in Subscription.objects.order_by().values('target_id').annotate(total=models.Count('id'))
+    }
+    recent = {}
+    entries = []
+    pairs = Subscription.objects.order_by('target_id').values_list('subscriber_id', 'target_id')
+    for subscriber_id, target_id in pairs.iterator(chunk_size=2000):
+        if followers.get(target_id, 0) >= threshold:
+            continue
+        if target_id not in recent:
+            recent = {target_id: list(
+                Post.objects.filter(author_id=target_id)
+                .order_by('-created_at')
+                .values_list('id', 'created_at')[:limit]
+            )}
+        entries.extend(
+            TimelineEntry(owner_id=subscriber_id, post_id=post_id, author_id=target_id, created_at=created_at)
+            for post_id, created_at in recent[target_id]
+        )
+        if len(entries) >= batch_size:
+            TimelineEntry.objects.bulk_create(entries, batch_size=batch_size, ignore_conflicts=True)
+            entries = []
+    TimelineEntry.objects.bulk_create(entries, batch_size=batch_size, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.member')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='api.member')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='api.post')),
+            ],
+            options={
+                'db_table': 'timeline_entries',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['owner', '-created_at'], name='timeline_owner_created_idx'), models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx')],
+                'unique_together': {('owner', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated migration
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(model, fk):
+    subquery = (
+        model.objects.filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(subquery), 0)
+
+
+def populate_counters(apps, schema_editor):
+    Member = apps.get_model('api', 'Member')
+    Post = apps.get_model('api', 'Post')
+    Like = apps.get_model('api', 'Like')
+    Comment = apps.get_model('api', 'Comment')
+    Subscription = apps.get_model('api', 'Subscription')
+
+    Post.objects.update(
+        likes_count=_count(Like, 'post'),
+        comments_count=_count(Comment, 'post'),
+    )
+    Member.objects.update(
+        followers_count=_count(Subscription, 'target'),
+        following_count=_count(Subscription, 'subscriber'),
+        posts_count=_count(Post, 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='followers_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='following_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='posts_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated migration
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_conversations(apps, schema_editor):
+    Message = apps.get_model('api', 'Message')
+    Conversation = apps.get_model('api', 'Conversation')
+
+    conversations = {}
+    messages = Message.objects.order_by('created_at', 'id').iterator(chunk_size=2000)
+    for message in messages:
+        sides = [(message.sender_id, message.receiver_id, 0)]
+        if message.sender_id != message.receiver_id:
+            sides.append((message.receiver_id, message.sender_id, 0 if message.is_read else 1))
+        for owner_id, participant_id, unread in sides:
+            conversation = conversations.get((owner_id, participant_id))
+            if conversation is None:
+                conversation = conversations[(owner_id, participant_id)] = Conversation(
+                    owner_id=owner_id,
+                    participant_id=participant_id,
+                )
+            conversation.last_message_id = message.id
+            conversation.last_message_at = message.created_at
+            conversation.unread_count += unread
+
+    Conversation.objects.bulk_create(conversations.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_count', models.IntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.message')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to='api.member')),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.member')),
+            ],
+            options={
+                'db_table': 'conversations',
+                'ordering': ['-last_message_at'],
+                'indexes': [models.Index(fields=['owner', '-last_message_at'], name='conversations_owner_last_idx')],
+                'unique_together': {('owner', 'participant')},
+            },
+        ),
+        migrations.RunPython(populate_conversations, migrations.RunPython.noop),
+    ]
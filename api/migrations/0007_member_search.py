@@ -0,0 +1,73 @@
+# Generated migration
+
+from django.db import migrations
+
+
+SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE members_fts USING fts5(
+        username, first_name, last_name,
+        content='members', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER members_fts_ai AFTER INSERT ON members BEGIN
+        INSERT INTO members_fts(rowid, username, first_name, last_name)
+        VALUES (new.id, new.username, new.first_name, new.last_name);
+    END
+    """,
+    """
+    CREATE TRIGGER members_fts_ad AFTER DELETE ON members BEGIN
+        INSERT INTO members_fts(members_fts, rowid, username, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+    END
+    """,
+    """
+    CREATE TRIGGER members_fts_au AFTER UPDATE OF username, first_name, last_name ON members BEGIN
+        INSERT INTO members_fts(members_fts, rowid, username, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+        INSERT INTO members_fts(rowid, username, first_name, last_name)
+        VALUES (new.id, new.username, new.first_name, new.last_name);
+    END
+    """,
+    "INSERT INTO members_fts(members_fts) VALUES ('rebuild')",
+]
+
+REVERSE = [
+    "DROP TRIGGER IF EXISTS members_fts_au",
+    "DROP TRIGGER IF EXISTS members_fts_ad",
+    "DROP TRIGGER IF EXISTS members_fts_ai",
+    "DROP TABLE IF EXISTS members_fts",
+]
+
+
+def fts5_supported(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or not fts5_supported(connection):
+        return
+    for statement in SCHEMA:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in REVERSE:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_token_revocation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
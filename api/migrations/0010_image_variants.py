@@ -0,0 +1,64 @@
+# Generated migration
+
+from django.db import migrations, models
+
+
+COLUMNS = [
+    ('member', 'members', 'avatar_variants'),
+    ('post', 'posts', 'image_variants'),
+]
+
+
+def variants_field(column):
+    field = models.JSONField(blank=True, default=dict)
+    field.set_attributes_from_name(column)
+    return field
+
+
+def add_columns(apps, schema_editor):
+    # On SQLite, AddField with a default rebuilds the table, which would drop
+    # the FTS triggers from 0007/0008 and copy every row. ADD COLUMN with a
+    # constant default does neither.
+    for model_name, table, column in COLUMNS:
+        if schema_editor.connection.vendor == 'sqlite':
+            schema_editor.execute(
+                f"ALTER TABLE {table} ADD COLUMN {column} text NOT NULL DEFAULT '{{}}' "
+                f"CHECK ((JSON_VALID({column}) OR {column} IS NULL))"
+            )
+        else:
+            schema_editor.add_field(apps.get_model('api', model_name), variants_field(column))
+
+
+def remove_columns(apps, schema_editor):
+    for model_name, table, column in COLUMNS:
+        if schema_editor.connection.vendor == 'sqlite':
+            schema_editor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+        else:
+            schema_editor.remove_field(apps.get_model('api', model_name), variants_field(column))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='member',
+                    name='avatar_variants',
+                    field=models.JSONField(blank=True, default=dict),
+                ),
+                migrations.AddField(
+                    model_name='post',
+                    name='image_variants',
+                    field=models.JSONField(blank=True, default=dict),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_columns, remove_columns),
+            ],
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated migration
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+TABLES = [
+    ('member', 'members'),
+    ('post', 'posts'),
+]
+
+
+def updated_at_field(**kwargs):
+    field = models.DateTimeField(**kwargs)
+    field.set_attributes_from_name('updated_at')
+    return field
+
+
+def add_columns(apps, schema_editor):
+    # ADD COLUMN instead of AddField for the reason given in 0010: a table
+    # rebuild would drop the FTS triggers. Existing rows start out at their
+    # creation time.
+    for model_name, table in TABLES:
+        if schema_editor.connection.vendor == 'sqlite':
+            schema_editor.execute(
+                f"ALTER TABLE {table} ADD COLUMN updated_at datetime NOT NULL DEFAULT '1970-01-01 00:00:00'"
+            )
+        else:
+            schema_editor.add_field(apps.get_model('api', model_name), updated_at_field(default=timezone.now))
+        schema_editor.execute(f"UPDATE {table} SET updated_at = created_at")
+
+
+def remove_columns(apps, schema_editor):
+    for model_name, table in TABLES:
+        if schema_editor.connection.vendor == 'sqlite':
+            schema_editor.execute(f"ALTER TABLE {table} DROP COLUMN updated_at")
+        else:
+            schema_editor.remove_field(apps.get_model('api', model_name), updated_at_field())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_image_variants'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='member',
+                    name='updated_at',
+                    field=models.DateTimeField(auto_now=True),
+                ),
+                migrations.AddField(
+                    model_name='post',
+                    name='updated_at',
+                    field=models.DateTimeField(auto_now=True),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_columns, remove_columns),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'updated_at'], name='posts_author_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated migration
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('operation', models.CharField(max_length=20)),
+                ('target_id', models.BigIntegerField()),
+                ('status', models.PositiveSmallIntegerField()),
+                ('body', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.member')),
+            ],
+            options={
+                'db_table': 'idempotency_records',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['member', 'created_at'], name='idempotency_member_created_idx')],
+                'unique_together': {('member', 'key')},
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Exists, OuterRef, Value
 from django.contrib.auth.hashers import make_password, check_password
 from django.utils import timezone
 
@@ -10,14 +11,27 @@ class Member(models.Model):
     first_name = models.CharField(max_length=150, blank=True, default='')
     last_name = models.CharField(max_length=150, blank=True, default='')
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # Resized copies written by api.images: {variant: {name, width, height}}
+    avatar_variants = models.JSONField(default=dict, blank=True)
     bio = models.TextField(blank=True, default='')
     is_online = models.BooleanField(default=False)
     last_seen = models.DateTimeField(null=True, blank=True)
+    followers_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+    posts_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by every write that changes the profile representation, including
+    # counter, presence-flag and avatar updates; conditional GETs use it.
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'members'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['username'], name='members_username_idx'),
+            models.Index(fields=['email'], name='members_email_idx'),
+            models.Index(fields=['created_at'], name='members_created_at_idx'),
+        ]
 
     def __str__(self):
         return self.username
@@ -43,6 +57,21 @@ class Member(models.Model):
         return True
 
 
+class PostQuerySet(models.QuerySet):
+    def for_listing(self, viewer=None):
+        """
+        Join the author and annotate the viewer's like status, so serializing
+        a page of posts costs a fixed number of queries regardless of its size.
+        Like and comment counts are denormalized onto the post row.
+        """
+        if isinstance(viewer, Member):
+            is_liked = Exists(Like.objects.filter(post=OuterRef('pk'), user=viewer))
+        else:
+            is_liked = Value(False, output_field=models.BooleanField())
+
+        return self.select_related('author').annotate(is_liked=is_liked)
+
+
 class Post(models.Model):
     author = models.ForeignKey(
         Member,
@@ -51,11 +80,24 @@ class Post(models.Model):
     )
     content = models.TextField()
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    # Resized copies written by api.images: {variant: {name, width, height}}
+    image_variants = models.JSONField(default=dict, blank=True)
+    likes_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by every write that changes the post, including counter updates.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         db_table = 'posts'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='posts_created_at_idx'),
+            models.Index(fields=['author', 'created_at'], name='posts_author_created_idx'),
+            models.Index(fields=['author', 'updated_at'], name='posts_author_updated_idx'),
+        ]
 
     def __str__(self):
         return f'Post by {self.author.username} at {self.created_at}'
@@ -100,6 +142,9 @@ class Comment(models.Model):
     class Meta:
         db_table = 'comments'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['post', 'created_at'], name='comments_post_created_idx'),
+        ]
 
     def __str__(self):
         return f'Comment by {self.author.username} on post {self.post.id}'
@@ -122,6 +167,10 @@ class Subscription(models.Model):
         db_table = 'subscriptions'
         unique_together = ('subscriber', 'target')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['target', 'created_at'], name='subs_target_created_idx'),
+            models.Index(fields=['subscriber', 'created_at'], name='subs_subscriber_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.subscriber.username} follows {self.target.username}'
@@ -145,6 +194,113 @@ class Message(models.Model):
     class Meta:
         db_table = 'messages'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='messages_created_at_idx'),
+            models.Index(fields=['sender', 'receiver', 'created_at'], name='messages_pair_created_idx'),
+            models.Index(fields=['receiver', 'is_read'], name='messages_receiver_read_idx'),
+        ]
 
     def __str__(self):
         return f'Message from {self.sender.username} to {self.receiver.username}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Materialized home-feed row: one per (follower, post) pair, written when
+    a post is fanned out to the author's subscribers.
+    """
+    owner = models.ForeignKey(
+        Member,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        Member,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'timeline_entries'
+        unique_together = ('owner', 'post')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at'], name='timeline_owner_created_idx'),
+            models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'Post {self.post_id} in timeline of {self.owner_id}'
+
+
+class Conversation(models.Model):
+    """
+    Dialog list read model: one row per side of each member pair, holding the
+    latest message and how many messages the owner has not read yet.
+    """
+    owner = models.ForeignKey(
+        Member,
+        on_delete=models.CASCADE,
+        related_name='conversations'
+    )
+    participant = models.ForeignKey(
+        Member,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    last_message = models.ForeignKey(
+        Message,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    unread_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'conversations'
+        unique_together = ('owner', 'participant')
+        ordering = ['-last_message_at']
+        indexes = [
+            models.Index(fields=['owner', 'last_message_at'], name='conversations_owner_last_idx'),
+        ]
+
+    def __str__(self):
+        return f'Conversation of {self.owner_id} with {self.participant_id}'
+
+
+class IdempotencyRecord(models.Model):
+    """
+    The result of a batched write operation, stored under the key the client
+    sent with it so a replayed operation is answered without being applied
+    again.
+    """
+    member = models.ForeignKey(
+        Member,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    key = models.CharField(max_length=64)
+    operation = models.CharField(max_length=20)
+    target_id = models.BigIntegerField()
+    status = models.PositiveSmallIntegerField()
+    body = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'idempotency_records'
+        unique_together = ('member', 'key')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['member', 'created_at'], name='idempotency_member_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.operation} {self.target_id} by {self.member_id} ({self.key})'
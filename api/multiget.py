@@ -0,0 +1,62 @@
+"""
+Multi-get: ``?ids=`` on the post and member list endpoints.
+
+Clients that already hold ids (from notifications, messages or their own
+cache) fetch up to MULTI_GET_MAX_IDS objects in one request and one
+``id IN (...)`` query instead of one detail request each. The response is
+keyed by id in the order the ids were asked for; ids that do not exist map
+to ``null`` and are also listed in ``not_found``.
+"""
+from django.conf import settings
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework.exceptions import ValidationError
+
+
+def max_ids():
+    return getattr(settings, 'MULTI_GET_MAX_IDS', 200)
+
+
+def requested_ids(request):
+    """
+    The ids of a multi-get request, in order and without duplicates, or
+    None when the request is a normal listing. Raises ``ValidationError``
+    (400) for malformed or too many ids.
+    """
+    raw = request.query_params.get('ids')
+    if raw is None:
+        return None
+    try:
+        ids = [int(part) for part in raw.split(',') if part.strip()]
+    except ValueError:
+        raise ValidationError({'error': 'Invalid parameters', 'detail': "'ids' must be comma-separated integers"})
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValidationError({'error': 'Invalid parameters', 'detail': "'ids' must not be empty"})
+    if len(ids) > max_ids():
+        raise ValidationError({
+            'error': 'Invalid parameters',
+            'detail': f"At most {max_ids()} ids can be requested at once, got {len(ids)}",
+        })
+    return ids
+
+
+def keyed(ids, found_ids, data):
+    """The response body for ``ids``, where ``data[i]`` is the object with id ``found_ids[i]``."""
+    found = dict(zip(found_ids, data))
+    return {
+        'results': {str(pk): found.get(pk) for pk in ids},
+        'not_found': [pk for pk in ids if pk not in found],
+    }
+
+
+IDS_PARAMETER = OpenApiParameter(
+    name='ids',
+    type=OpenApiTypes.STR,
+    location=OpenApiParameter.QUERY,
+    description=(
+        "Comma-separated ids to fetch instead of a page (at most MULTI_GET_MAX_IDS, 200 by default). "
+        "The response maps each id to its object, or null if it does not exist"
+    ),
+    required=False,
+)
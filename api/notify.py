@@ -0,0 +1,119 @@
+"""
+In-process wake-ups for long-polling requests.
+
+A ``Notifier`` maps keys (member ids) to the futures of coroutines that are
+waiting on them. ``notify`` may be called from any thread, typically a sync
+view running in the ASGI server's thread pool, and resolves the waiters on
+their own event loops. An idle waiter is just a future: it holds no thread
+and does not poll the database.
+
+``run_sync`` runs the short database work around the wait (authentication,
+the checks before and after) on a small shared thread pool.
+
+Only waiters in the same process are woken. When the process that stores a
+message is not the one holding the waiter (several server processes, or a
+WSGI worker), the waiter sleeps until its timeout and then finds the
+message with its final check, so delivery is late but never lost.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+def _resolve(future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+class Notifier:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = {}
+
+    @contextmanager
+    def listen(self, key):
+        """
+        Register a waiter for ``key`` on the running event loop and yield its
+        future, which ``notify`` resolves. Register before checking for the
+        event, so one that happens in between is not missed.
+        """
+        loop = asyncio.get_running_loop()
+        entry = (loop, loop.create_future())
+        with self.lock:
+            self.waiters.setdefault(key, set()).add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self.lock:
+                waiting = self.waiters.get(key)
+                if waiting is not None:
+                    waiting.discard(entry)
+                    if not waiting:
+                        del self.waiters[key]
+
+    def notify(self, key, value=None):
+        """Wake every coroutine currently waiting on ``key``; returns how many there were."""
+        with self.lock:
+            waiting = self.waiters.pop(key, ())
+        for loop, future in waiting:
+            try:
+                loop.call_soon_threadsafe(_resolve, future, value)
+            except RuntimeError:
+                # The waiter's loop has been closed; nobody is left to wake.
+                pass
+        return len(waiting)
+
+    def waiting(self, key):
+        with self.lock:
+            return len(self.waiters.get(key, ()))
+
+
+# Keyed by receiver id; the value is the id of the new message.
+messages = Notifier()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def workers():
+    """Size of the pool used by ``run_sync``; 0 uses ``sync_to_async`` instead."""
+    return getattr(settings, 'MESSAGE_WAIT_WORKERS', 4)
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers(), thread_name_prefix='long-poll')
+        return _executor
+
+
+def _call(func, *args):
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_sync(func, *args):
+    """
+    Call the sync ``func`` from a long-polling view.
+
+    ``sync_to_async`` would run it on the thread Django's ASGI handler sets
+    aside for the request, which would then keep a database connection open
+    for as long as the request waits. The pool's threads are shared and keep
+    their own connections, so waiters hold none. With
+    ``MESSAGE_WAIT_WORKERS = 0`` it falls back to ``sync_to_async``, which
+    lets tests see their own uncommitted data.
+    """
+    if workers() == 0:
+        return await sync_to_async(func)(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), partial(_call, func, *args))
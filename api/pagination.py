@@ -0,0 +1,148 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.encoding import force_str
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def combine(arms, ordering=('-created_at', '-id')):
+    """
+    Merge querysets that are each ordered by an index into one ``UNION ALL``.
+
+    SQLite serves every arm from its own index and merges the sorted streams,
+    where a single query with an ``OR`` between the arms would collect all
+    matching rows and sort them in a temporary B-tree.
+    """
+    arms = [arm.order_by() for arm in arms]
+    if len(arms) == 1:
+        return arms[0].order_by(*ordering)
+    return arms[0].union(*arms[1:], all=True).order_by(*ordering)
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if isinstance(queryset, (list, tuple)):
+            queryset = combine(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over ``(created_at, id)``, newest first.
+
+    Each page is fetched with an indexed range condition instead of an
+    OFFSET, and no COUNT query is issued, so deep pages cost the same as
+    the first one. Only forward navigation is supported.
+
+    A list of querysets is paged as their ``UNION ALL``, with the range
+    condition applied to each arm so every arm stays on its index.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        arms = list(queryset) if isinstance(queryset, (list, tuple)) else [queryset]
+        if position is not None:
+            created_at, pk = position
+            arms = [
+                arm.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+                for arm in arms
+            ]
+
+        results = list(combine(arms)[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        if isinstance(last, dict):
+            position = (last['created_at'], last['id'])
+        else:
+            position = (last.created_at, last.id)
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+
+    def encode_cursor(self, position):
+        created_at, pk = position
+        raw = f'{created_at.isoformat()}|{pk}'
+        return force_str(base64.urlsafe_b64encode(raw.encode('ascii')).rstrip(b'='))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii')
+            created_at, pk = raw.rsplit('|', 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+def paginator_for(request, pagination_class=StandardResultsSetPagination):
+    """
+    Pick the paginator for a list request: keyset pagination when the client
+    asks for it with ``?pagination=cursor`` or passes a ``cursor``, otherwise
+    the view's page-number pagination.
+    """
+    params = request.query_params
+    if params.get('pagination') == 'cursor' or KeysetPagination.cursor_query_param in params:
+        return KeysetPagination()
+    return pagination_class()
+
+
+CURSOR_PARAMETERS = [
+    OpenApiParameter(
+        name='pagination',
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+        description="Set to 'cursor' for keyset pagination",
+        required=False,
+        enum=['cursor'],
+    ),
+    OpenApiParameter(
+        name='cursor',
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+        description="Opaque cursor taken from the previous page's next link",
+        required=False,
+    ),
+]
@@ -0,0 +1,142 @@
+"""
+Write-coalescing presence tracking.
+
+Every authenticated request (and the explicit heartbeat endpoint) records
+"seen now" for the member in a per-worker buffer. The buffer is flushed to
+``Member.last_seen`` with batched UPDATEs at most once every
+``PRESENCE_FLUSH_INTERVAL`` seconds: by the first touch or finished request
+(of any member, or anonymous) after the interval has passed, and when the
+process exits. A member is reported online while they are logged in and were
+seen within the last ``PRESENCE_TTL`` seconds. A worker that is killed
+rather than stopped loses at most the activity since its last flush, which
+only makes ``last_seen`` slightly older.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from api import metrics
+from api.models import Member
+
+
+logger = logging.getLogger(__name__)
+
+
+def ttl():
+    return getattr(settings, 'PRESENCE_TTL', 120)
+
+
+def flush_interval():
+    return getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 5)
+
+
+class PresenceBuffer:
+    batch_size = 500
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+
+    def touch(self, member_id, seen_at=None):
+        with self.lock:
+            self.pending[member_id] = seen_at or timezone.now()
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        with self.lock:
+            due = bool(self.pending) and time.monotonic() - self.flushed_at >= flush_interval()
+        if due:
+            self.flush()
+
+    def forget(self, member_id):
+        with self.lock:
+            self.pending.pop(member_id, None)
+
+    def seen_at(self, member_id):
+        return self.pending.get(member_id)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return 0
+
+        members = [Member(id=member_id, last_seen=seen_at) for member_id, seen_at in pending.items()]
+        try:
+            with metrics.housekeeping():
+                Member.objects.bulk_update(members, ['last_seen'], batch_size=self.batch_size)
+        except Exception:
+            logger.exception("Failed to flush presence for %d member(s)", len(members))
+            with self.lock:
+                for member_id, seen_at in pending.items():
+                    self.pending.setdefault(member_id, seen_at)
+            return 0
+        return len(members)
+
+
+buffer = PresenceBuffer()
+
+
+def touch(member_id):
+    buffer.touch(member_id)
+
+
+def flush_due(**kwargs):
+    """``request_finished`` receiver: flush once the interval has passed, even without another touch."""
+    buffer.flush_if_due()
+
+
+def flush_at_exit():
+    buffer.flush()
+
+
+def last_seen(member):
+    """Latest known activity: the buffered heartbeat or the stored value."""
+    return latest_seen(member.id, member.last_seen)
+
+
+def latest_seen(member_id, stored):
+    buffered = buffer.seen_at(member_id)
+    if buffered is None:
+        return stored
+    if stored is None:
+        return buffered
+    return max(buffered, stored)
+
+
+def online_cutoff():
+    """Members last seen before this are offline."""
+    return timezone.now() - timedelta(seconds=ttl())
+
+
+def is_online(member):
+    return online(member.id, member.is_online, member.last_seen)
+
+
+def online(member_id, logged_in, stored_last_seen, cutoff=None):
+    """``is_online`` from column values; pass ``cutoff`` to reuse one across a page."""
+    if not logged_in:
+        return False
+    seen = latest_seen(member_id, stored_last_seen)
+    return seen is not None and seen >= (cutoff or online_cutoff())
+
+
+def mark_online(member):
+    now = timezone.now()
+    Member.objects.filter(id=member.id).update(is_online=True, last_seen=now, updated_at=now)
+    member.is_online = True
+    member.last_seen = now
+
+
+def mark_offline(member):
+    now = timezone.now()
+    buffer.forget(member.id)
+    Member.objects.filter(id=member.id).update(is_online=False, last_seen=now, updated_at=now)
+    member.is_online = False
+    member.last_seen = now
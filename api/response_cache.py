@@ -0,0 +1,180 @@
+"""
+Shared cache of anonymous post listing pages.
+
+Anonymous visitors all get the same page for a URL, so ``respond`` stores
+the paginated response data in the cache named by RESPONSE_CACHE_ALIAS (a
+file-based cache shared by all gunicorn workers) and serves it to later
+anonymous requests. Authenticated requests are never cached: ``is_liked``
+depends on the viewer.
+
+Keys embed the current version of their scope: ``posts`` for the global
+listing and ``author:<id>`` for one member's posts. ``posts_changed`` gives
+both scopes a fresh random version after the writing transaction commits,
+which orphans every page built before the change; orphaned entries expire
+after RESPONSE_CACHE_TIMEOUT seconds. Versions are random rather than
+incremented because the file-based backend's ``incr`` is not atomic, and two
+racing bumps must not settle on a value a reader has already used.
+
+Presence (``is_online`` of embedded authors) is not versioned, so cached
+pages may show it up to RESPONSE_CACHE_TIMEOUT seconds out of date.
+
+Each response reports ``X-Cache: HIT`` or ``MISS``. Hit and miss counts are
+kept per worker and added to shared totals in the cache every
+RESPONSE_CACHE_STATS_INTERVAL seconds; RESPONSE_CACHE_STATS_HOOK, if set,
+is called with each worker's counts as they are flushed, and the
+``response_cache_stats`` management command reports the totals.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.response import Response
+
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_SCOPE = 'posts'
+
+# Statistics labels of the cached listings (their URL names).
+LISTINGS = ['post-list-create', 'user-posts']
+
+
+def cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def timeout():
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60)
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def version(scope):
+    key = f'version:{scope}'
+    value = cache().get(key)
+    if value is None:
+        # First use, or the version was evicted: any new value orphans the
+        # pages stored under the old one.
+        cache().add(key, uuid.uuid4().hex, timeout=None)
+        value = cache().get(key)
+    return value
+
+
+def bump(*scopes):
+    cache().set_many({f'version:{scope}': uuid.uuid4().hex for scope in scopes}, timeout=None)
+
+
+def posts_changed(author_id):
+    """
+    Invalidate the global listing and ``author_id``'s posts once the current
+    transaction commits: a post was created or deleted, its like or comment
+    count changed, or its author's profile changed.
+    """
+    transaction.on_commit(lambda: bump(GLOBAL_SCOPE, author_scope(author_id)))
+
+
+def page_key(scope, request):
+    # The full URL, host included, because pagination links are absolute.
+    digest = hashlib.blake2b(request.build_absolute_uri().encode(), digest_size=12).hexdigest()
+    return f'page:{scope}:{version(scope)}:{digest}'
+
+
+def respond(request, name, scope, build):
+    """
+    The response for a listing page. Anonymous requests are served from the
+    cache when possible; ``build()`` makes the response otherwise. ``name``
+    labels the listing in the hit and miss statistics.
+    """
+    if request.user.is_authenticated:
+        return build()
+
+    key = page_key(scope, request)
+    data = cache().get(key)
+    stats.record(name, hit=data is not None)
+    if data is not None:
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    response = build()
+    if response.status_code == 200:
+        cache().set(key, response.data, timeout())
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def stats_interval():
+    return getattr(settings, 'RESPONSE_CACHE_STATS_INTERVAL', 10)
+
+
+class CacheStats:
+    """Per-worker hit and miss counts, added to shared totals in the cache periodically."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+
+    def record(self, name, hit):
+        with self.lock:
+            hits, misses = self.pending.get(name, (0, 0))
+            self.pending[name] = (hits + 1, misses) if hit else (hits, misses + 1)
+            due = time.monotonic() - self.flushed_at >= stats_interval()
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return pending
+
+        shared = cache()
+        for name, counts in pending.items():
+            for kind, count in zip(('hits', 'misses'), counts):
+                if count:
+                    key = f'stats:{name}:{kind}'
+                    shared.add(key, 0, timeout=None)
+                    try:
+                        shared.incr(key, count)
+                    except ValueError:
+                        # Evicted between add() and incr().
+                        shared.set(key, count, timeout=None)
+
+        hook = getattr(settings, 'RESPONSE_CACHE_STATS_HOOK', None)
+        if hook:
+            try:
+                import_string(hook)(summarize(pending))
+            except Exception:
+                logger.exception('Response cache stats hook %s failed', hook)
+        return pending
+
+
+stats = CacheStats()
+
+
+def summarize(counts):
+    """``{name: {hits, misses, hit_ratio}}`` from ``{name: (hits, misses)}``."""
+    summary = {}
+    for name, (hits, misses) in sorted(counts.items()):
+        total = hits + misses
+        summary[name] = {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else None}
+    return summary
+
+
+def totals(names):
+    """Shared hit and miss totals of all workers for the listings in ``names``."""
+    shared = cache()
+    return summarize({
+        name: (shared.get(f'stats:{name}:hits', 0), shared.get(f'stats:{name}:misses', 0))
+        for name in names
+    })
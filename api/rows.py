@@ -0,0 +1,172 @@
+"""
+Lean serialization of read-only list pages.
+
+The ModelSerializers in api.serializers run every field of every row through
+``get_attribute`` and ``to_representation`` on a tree of field objects, which
+dominates the CPU time of a 100-row page. ``render`` produces the same JSON
+from ``values()`` rows instead: every field of a representation
+(api.fieldsets) has an extractor, which is compiled once per page with the
+page's state (storage, the request for absolute URLs, the presence cutoff,
+the time zone) bound in, and rows are then turned into dicts directly.
+
+Keys and value formats must stay in step with the serializers; RowParityTests
+compares the two. Single objects and write responses keep the serializers.
+"""
+from operator import itemgetter
+
+from django.conf import settings
+from django.utils import timezone
+
+from api import fieldsets, images, metrics, presence
+from api.fieldsets import Fieldset
+from api.models import Member, Post
+
+
+def _datetime_format():
+    """Like DRF's ISO 8601 ``DateTimeField.to_representation`` in the current time zone."""
+    zone = timezone.get_current_timezone() if settings.USE_TZ else None
+
+    def iso(value):
+        if not value:
+            return None
+        if zone is not None:
+            value = value.astimezone(zone)
+        text = value.isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+
+    return iso
+
+
+class Page:
+    """State shared by the extractors of one page."""
+
+    def __init__(self, request):
+        self.request = request
+        self.cutoff = presence.online_cutoff()
+        self.datetime = _datetime_format()
+
+
+# Extractor factories: ``factory(page, prefix)`` returns ``row -> value``.
+
+def _column(lookup):
+    def compile(page, prefix):
+        return itemgetter(prefix + lookup)
+    return compile
+
+
+def _datetime(lookup):
+    def compile(page, prefix):
+        key, iso = prefix + lookup, page.datetime
+        return lambda row: iso(row[key])
+    return compile
+
+
+def _file(model, name):
+    """Like DRF's ``FileField.to_representation`` for a stored file name."""
+    def compile(page, prefix):
+        key, storage = prefix + name, model._meta.get_field(name).storage
+        build = page.request.build_absolute_uri if page.request is not None else None
+
+        def url(row):
+            stored = row[key]
+            if not stored:
+                return None
+            location = storage.url(stored)
+            return build(location) if build else location
+
+        return url
+    return compile
+
+
+def _variants(model, name):
+    def compile(page, prefix):
+        key, variants_key = prefix + name, f'{prefix}{name}_variants'
+        storage, request = model._meta.get_field(name).storage, page.request
+        return lambda row: images.stored_urls(row[variants_key], storage, request) if row[key] else None
+    return compile
+
+
+def _online(page, prefix):
+    id_key, online_key, last_seen_key = prefix + 'id', prefix + 'is_online', prefix + 'last_seen'
+    cutoff = page.cutoff
+    return lambda row: presence.online(row[id_key], row[online_key], row[last_seen_key], cutoff)
+
+
+EXTRACTORS = {
+    fieldsets.MEMBER_SHORT: {
+        'id': _column('id'),
+        'username': _column('username'),
+        'first_name': _column('first_name'),
+        'last_name': _column('last_name'),
+        'avatar': _file(Member, 'avatar'),
+        'avatar_variants': _variants(Member, 'avatar'),
+        'is_online': _online,
+    },
+    fieldsets.POST: {
+        'id': _column('id'),
+        'content': _column('content'),
+        'image': _file(Post, 'image'),
+        'image_variants': _variants(Post, 'image'),
+        'likes_count': _column('likes_count'),
+        'comments_count': _column('comments_count'),
+        'is_liked': _column('is_liked'),
+        'created_at': _datetime('created_at'),
+    },
+    fieldsets.COMMENT: {
+        'id': _column('id'),
+        'post': _column('post_id'),
+        'content': _column('content'),
+        'created_at': _datetime('created_at'),
+    },
+    fieldsets.MESSAGE: {
+        'id': _column('id'),
+        'sender': _column('sender_id'),
+        'receiver': _column('receiver_id'),
+        'content': _column('content'),
+        'is_read': _column('is_read'),
+        'created_at': _datetime('created_at'),
+    },
+}
+
+
+def _compile(fieldset, page, prefix=''):
+    extractors = EXTRACTORS[fieldset.representation]
+    relations = fieldset.representation.relations
+    getters = []
+    for name in fieldset.names:
+        if name in fieldset.nested:
+            getters.append((name, _compile(fieldset.nested[name], page, f'{prefix}{name}__')))
+        elif name in relations:
+            getters.append((name, itemgetter(prefix + relations[name][0])))
+        else:
+            getters.append((name, extractors[name](page, prefix)))
+    return lambda row: {name: get(row) for name, get in getters}
+
+
+def render(rows, fieldset, request=None):
+    """The serializer output for ``rows``, which must carry ``fieldset.lookups()``."""
+    with metrics.serializing():
+        build = _compile(fieldset, Page(request))
+        return [build(row) for row in rows]
+
+
+# Lookups of the full representations, as the serializers render them.
+POST = tuple(Fieldset(fieldsets.POST).lookups())
+COMMENT = tuple(Fieldset(fieldsets.COMMENT).lookups())
+MESSAGE = tuple(Fieldset(fieldsets.MESSAGE).lookups())
+
+
+def posts(rows, request=None):
+    """``PostSerializer(many=True).data`` for rows with ``POST`` from ``Post.objects.for_listing()``."""
+    return render(rows, Fieldset(fieldsets.POST), request)
+
+
+def comments(rows):
+    """``CommentSerializer(many=True).data`` for rows with ``COMMENT``."""
+    # CommentSerializer is used without a request, so URLs stay relative.
+    return render(rows, Fieldset(fieldsets.COMMENT))
+
+
+def messages(rows):
+    """``MessageSerializer(many=True).data`` for rows with ``MESSAGE``."""
+    return render(rows, Fieldset(fieldsets.MESSAGE))
@@ -0,0 +1,145 @@
+"""
+SQLite FTS5 shadow indexes used by the search endpoints.
+
+The virtual tables and the triggers keeping them in sync are created by
+migrations; when they are missing (another database backend, or SQLite
+built without FTS5) callers fall back to plain ORM filtering.
+"""
+import html
+import re
+
+from django.db import connection
+
+
+MEMBER_SEARCH_TABLE = 'members_fts'
+
+# Kept in sync with migration 0007_member_search, which carries a frozen copy.
+MEMBER_SEARCH_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE members_fts USING fts5(
+        username, first_name, last_name,
+        content='members', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER members_fts_ai AFTER INSERT ON members BEGIN
+        INSERT INTO members_fts(rowid, username, first_name, last_name)
+        VALUES (new.id, new.username, new.first_name, new.last_name);
+    END
+    """,
+    """
+    CREATE TRIGGER members_fts_ad AFTER DELETE ON members BEGIN
+        INSERT INTO members_fts(members_fts, rowid, username, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+    END
+    """,
+    """
+    CREATE TRIGGER members_fts_au AFTER UPDATE OF username, first_name, last_name ON members BEGIN
+        INSERT INTO members_fts(members_fts, rowid, username, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+        INSERT INTO members_fts(rowid, username, first_name, last_name)
+        VALUES (new.id, new.username, new.first_name, new.last_name);
+    END
+    """,
+    "INSERT INTO members_fts(members_fts) VALUES ('rebuild')",
+]
+
+POST_SEARCH_TABLE = 'posts_fts'
+
+# snippet() cannot escape the text it returns, so matches are marked with
+# control characters and turned into <mark> tags after HTML-escaping.
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+POST_SNIPPET = "snippet(posts_fts, 0, char(2), char(3), '…', 16)"
+
+# The trigram tokenizer cannot match anything shorter than one trigram.
+TRIGRAM_MIN_LENGTH = 3
+
+_available = {}
+
+
+def fts_available(table):
+    if connection.vendor != 'sqlite':
+        return False
+    if table not in _available:
+        _available[table] = table in connection.introspection.table_names()
+    return _available[table]
+
+
+def phrase(query):
+    """Quote user input as a single FTS5 phrase so operators are not parsed."""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def all_words(query):
+    """Match documents containing every word of the query, in any order."""
+    return ' '.join(phrase(word) for word in re.findall(r'\w+', query))
+
+
+def highlight(snippet):
+    return html.escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def rebuild(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+
+def optimize(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+
+
+class RankedResults:
+    """
+    Lazily evaluated search results in relevance order.
+
+    Behaves like a sliceable sequence with ``count()``, which is all
+    Django's ``Paginator`` needs: counting and each page are single queries
+    against the FTS index, and only the rows of the requested page are
+    loaded from the base table.
+    """
+
+    def __init__(self, queryset, table, match, rank='rank', columns=None):
+        self.queryset = queryset
+        self.table = table
+        self.match = match
+        self.rank = rank
+        # Extra FTS expressions to attach to each result, as {attribute: SQL}
+        self.columns = columns or {}
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT count(*) FROM {self.table} WHERE {self.table} MATCH %s',
+                    [self.match],
+                )
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice):
+            return self[k:k + 1][0]
+        start = k.start or 0
+        limit = -1 if k.stop is None else max(k.stop - start, 0)
+        select = ', '.join(['rowid', *self.columns.values()])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {select} FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY {self.rank}, rowid DESC LIMIT %s OFFSET %s',
+                [self.match, limit, start],
+            )
+            rows = cursor.fetchall()
+        objects = self.queryset.order_by().in_bulk([row[0] for row in rows])
+        results = []
+        for pk, *values in rows:
+            if pk in objects:
+                for attribute, value in zip(self.columns, values):
+                    setattr(objects[pk], attribute, value)
+                results.append(objects[pk])
+        return results
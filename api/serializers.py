@@ -1,21 +1,73 @@
+from django.conf import settings
 from rest_framework import serializers
+from api import images, presence, search
+from api.metrics import TimedSerializerMixin
 from api.models import Member, Post, Comment, Message, Subscription, Like
 
 
-class MemberShortSerializer(serializers.ModelSerializer):
+class FieldsetMixin:
+    """
+    Keep only the fields of ``context['fieldset']`` (api.fieldsets). Nested
+    serializers use the part of it for their relation.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.context.get('fieldset')
+        if fieldset is None:
+            return fields
+        path, node = [], self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        for name in reversed(path):
+            fieldset = fieldset.nested.get(name)
+            if fieldset is None:
+                return fields
+        return fieldset.trim(fields, serializers.IntegerField)
+
+
+class MemberShortSerializer(FieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """Short serializer for nested user representation"""
+    avatar_variants = serializers.SerializerMethodField()
+    is_online = serializers.SerializerMethodField()
+
     class Meta:
         model = Member
-        fields = ['id', 'username', 'first_name', 'last_name', 'avatar', 'is_online']
+        fields = ['id', 'username', 'first_name', 'last_name', 'avatar', 'avatar_variants', 'is_online']
         read_only_fields = ['id', 'username', 'first_name', 'last_name', 'avatar', 'is_online']
 
+    def get_avatar_variants(self, obj):
+        return images.urls(obj.avatar_variants, obj.avatar, self.context.get('request'))
 
-class MemberSerializer(serializers.ModelSerializer):
+    def get_is_online(self, obj):
+        return presence.is_online(obj)
+
+
+class MemberSerializer(FieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """Full member profile serializer"""
+    avatar_variants = serializers.SerializerMethodField()
+    is_online = serializers.SerializerMethodField()
+    last_seen = serializers.SerializerMethodField()
+
     class Meta:
         model = Member
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'avatar', 'bio', 'is_online', 'last_seen', 'created_at']
-        read_only_fields = ['id', 'username', 'email', 'created_at']
+        fields = [
+            'id', 'username', 'email', 'first_name', 'last_name', 'avatar', 'avatar_variants', 'bio',
+            'is_online', 'last_seen', 'followers_count', 'following_count', 'posts_count', 'created_at',
+        ]
+        read_only_fields = ['id', 'username', 'email', 'followers_count', 'following_count', 'posts_count', 'created_at']
+
+    def get_avatar_variants(self, obj):
+        return images.urls(obj.avatar_variants, obj.avatar, self.context.get('request'))
+
+    def get_is_online(self, obj):
+        return presence.is_online(obj)
+
+    def get_last_seen(self, obj):
+        last_seen = presence.last_seen(obj)
+        return serializers.DateTimeField().to_representation(last_seen) if last_seen else None
 
 
 class MemberRegistrationSerializer(serializers.ModelSerializer):
@@ -64,7 +116,7 @@ class ChangePasswordSerializer(serializers.Serializer):
     new_password = serializers.CharField(required=True, write_only=True, min_length=8)
 
 
-class TokenSerializer(serializers.Serializer):
+class TokenSerializer(TimedSerializerMixin, serializers.Serializer):
     """Serializer for token response"""
     token = serializers.CharField()
     user = MemberSerializer()
@@ -81,31 +133,46 @@ class PostCreateSerializer(serializers.ModelSerializer):
         }
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(FieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """Full post serializer with related data"""
     author = MemberShortSerializer(read_only=True)
-    likes_count = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
-        fields = ['id', 'author', 'content', 'image', 'likes_count', 'comments_count', 'is_liked', 'created_at']
-        read_only_fields = ['id', 'author', 'created_at']
-    
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-    
-    def get_comments_count(self, obj):
-        return obj.comments.count()
+        fields = [
+            'id', 'author', 'content', 'image', 'image_variants', 'likes_count', 'comments_count', 'is_liked',
+            'created_at',
+        ]
+        read_only_fields = ['id', 'author', 'likes_count', 'comments_count', 'created_at']
+
+    def get_image_variants(self, obj):
+        return images.urls(obj.image_variants, obj.image, self.context.get('request'))
     
     def get_is_liked(self, obj):
+        # Posts fetched through Post.objects.for_listing() carry this as an
+        # annotation; the per-object query is only a fallback.
+        if hasattr(obj, 'is_liked'):
+            return obj.is_liked
         request = self.context.get('request')
         if request and hasattr(request, 'user') and request.user.is_authenticated:
             return obj.likes.filter(user=request.user).exists()
         return False
 
 
+class PostSearchResultSerializer(PostSerializer):
+    """Post serializer with the highlighted search match"""
+    snippet = serializers.SerializerMethodField()
+
+    class Meta(PostSerializer.Meta):
+        fields = PostSerializer.Meta.fields + ['snippet']
+
+    def get_snippet(self, obj):
+        snippet = getattr(obj, 'search_snippet', None)
+        return search.highlight(snippet) if snippet is not None else None
+
+
 class CommentCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating comments"""
     class Meta:
@@ -116,7 +183,7 @@ class CommentCreateSerializer(serializers.ModelSerializer):
         }
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(FieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """Full comment serializer with author data"""
     author = MemberShortSerializer(read_only=True)
     post = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -127,7 +194,7 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'author', 'post', 'created_at']
 
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(FieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for messages"""
     class Meta:
         model = Message
@@ -145,7 +212,7 @@ class MessageCreateSerializer(serializers.ModelSerializer):
         }
 
 
-class DialogSerializer(serializers.Serializer):
+class DialogSerializer(TimedSerializerMixin, serializers.Serializer):
     """Serializer for dialog list"""
     id = serializers.IntegerField()
     participant = MemberShortSerializer()
@@ -153,7 +220,7 @@ class DialogSerializer(serializers.Serializer):
     unread_count = serializers.IntegerField()
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for subscriptions"""
     subscriber_id = serializers.IntegerField(source='subscriber.id', read_only=True)
     subscribed_to_id = serializers.IntegerField(source='target.id', read_only=True)
@@ -161,4 +228,34 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Subscription
         fields = ['id', 'subscriber_id', 'subscribed_to_id', 'created_at']
-        read_only_fields = ['id', 'subscriber_id', 'subscribed_to_id', 'created_at']
\ No newline at end of file
+        read_only_fields = ['id', 'subscriber_id', 'subscribed_to_id', 'created_at']
+
+
+class BatchOperationSerializer(serializers.Serializer):
+    """One operation of a batch: the action, its post or member id and an optional idempotency key"""
+    OPERATIONS = ['like', 'unlike', 'comment', 'subscribe', 'unsubscribe', 'message']
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    id = serializers.IntegerField(min_value=1)
+    content = serializers.CharField(required=False, allow_blank=True, trim_whitespace=False)
+    key = serializers.CharField(required=False, min_length=1, max_length=64)
+
+
+class BatchSerializer(serializers.Serializer):
+    """Serializer for batched write requests"""
+    operations = BatchOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, value):
+        limit = getattr(settings, 'BATCH_MAX_OPERATIONS', 100)
+        if len(value) > limit:
+            raise serializers.ValidationError(f'At most {limit} operations can be sent at once, got {len(value)}')
+        return value
+
+
+class BatchResultSerializer(serializers.Serializer):
+    """Result of one batched operation: what the single-action endpoint would have answered"""
+    op = serializers.CharField()
+    key = serializers.CharField(allow_null=True)
+    status = serializers.IntegerField()
+    body = serializers.JSONField()
+    replayed = serializers.BooleanField()
@@ -0,0 +1,196 @@
+"""
+Stateless signed auth tokens.
+
+A signed token carries everything needed to authenticate it::
+
+    s1.<member id>.<issued at>.<expires at>.<token id>.<password tag>.<signature>
+
+The signature is an HMAC of the other fields keyed by ``SECRET_KEY``, so
+verification needs no lookup of a token row. Authentication still loads the
+member itself (one query per request) to check the password tag and to
+serve as ``request.user``. Logout revokes a token by id:
+revoked ids are stored in ``token_revocations`` and mirrored in every worker
+by a Bloom filter refreshed from that table. The password tag is derived
+from the member's password hash, so changing the password invalidates all
+of the member's signed tokens at once.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework.exceptions import AuthenticationFailed
+
+from api import metrics
+from api.tokens import TokenRevocation
+
+
+PREFIX = 's1'
+SIGNATURE_SALT = 'api.signed_tokens.signature'
+PASSWORD_SALT = 'api.signed_tokens.password'
+
+
+class SignedToken:
+    def __init__(self, key, member_id, issued_at, expires_at, jti, password_tag):
+        self.key = key
+        self.member_id = member_id
+        self.issued_at = issued_at
+        self.expires_at = expires_at
+        self.jti = jti
+        self.password_tag = password_tag
+
+    def __str__(self):
+        return self.key
+
+    @property
+    def expires_at_datetime(self):
+        return datetime.fromtimestamp(self.expires_at, tz=dt_timezone.utc)
+
+
+def is_signed(key):
+    return key.startswith(PREFIX + '.')
+
+
+def password_tag(member):
+    return salted_hmac(PASSWORD_SALT, member.password_hash, algorithm='sha256').hexdigest()[:12]
+
+
+def _sign(payload):
+    return salted_hmac(SIGNATURE_SALT, payload, algorithm='sha256').hexdigest()
+
+
+def issue(member, ttl=None):
+    """Create a signed token for ``member`` valid for ``ttl`` seconds."""
+    if ttl is None:
+        ttl = getattr(settings, 'SIGNED_TOKEN_TTL', 14 * 24 * 3600)
+    issued_at = int(time.time())
+    payload = '.'.join([
+        PREFIX,
+        str(member.id),
+        str(issued_at),
+        str(issued_at + ttl),
+        secrets.token_hex(8),
+        password_tag(member),
+    ])
+    return f'{payload}.{_sign(payload)}'
+
+
+def verify(key):
+    """
+    Check the signature, expiry and revocation status of a signed token.
+    Raises ``AuthenticationFailed`` if any check fails.
+    """
+    payload, _, signature = key.rpartition('.')
+    if not payload or not constant_time_compare(signature, _sign(payload)):
+        raise AuthenticationFailed('Invalid token.')
+
+    try:
+        prefix, member_id, issued_at, expires_at, jti, tag = payload.split('.')
+        token = SignedToken(key, int(member_id), int(issued_at), int(expires_at), jti, tag)
+    except ValueError:
+        raise AuthenticationFailed('Invalid token.')
+
+    if token.expires_at <= time.time():
+        raise AuthenticationFailed('Token has expired.')
+    if revocations.is_revoked(token.jti):
+        raise AuthenticationFailed('Token has been revoked.')
+    return token
+
+
+def revoke(token):
+    # One INSERT OR IGNORE: revoking an already revoked token is a no-op.
+    TokenRevocation.objects.bulk_create(
+        [TokenRevocation(jti=token.jti, expires_at=token.expires_at_datetime)],
+        ignore_conflicts=True,
+    )
+    revocations.add(token.jti)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing."""
+
+    def __init__(self, size_bits=1 << 20, hash_count=7):
+        self.size_bits = size_bits
+        self.hash_count = hash_count
+        self.bits = bytearray(size_bits // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size_bits for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationFilter:
+    """
+    Per-process view of ``token_revocations``.
+
+    New rows are pulled in every ``SIGNED_TOKEN_REVOCATION_REFRESH`` seconds;
+    the filter is rebuilt from scratch (dropping expired ids) every
+    ``SIGNED_TOKEN_REVOCATION_REBUILD`` seconds. A filter hit is confirmed
+    against the table, so false positives never reject a valid token.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filter = None
+        self.rebuilt_at = 0.0
+        self.refreshed_at = 0.0
+        self.synced_until = None
+
+    def reset(self):
+        with self.lock:
+            self.filter = None
+
+    def add(self, jti):
+        self._ensure_fresh()
+        with self.lock:
+            self.filter.add(jti)
+
+    def is_revoked(self, jti):
+        self._ensure_fresh()
+        if jti not in self.filter:
+            return False
+        return TokenRevocation.objects.filter(jti=jti).exists()
+
+    def _ensure_fresh(self):
+        refresh_every = getattr(settings, 'SIGNED_TOKEN_REVOCATION_REFRESH', 5)
+        rebuild_every = getattr(settings, 'SIGNED_TOKEN_REVOCATION_REBUILD', 3600)
+        now = time.monotonic()
+        if (
+            self.filter is not None
+            and now - self.refreshed_at < refresh_every
+            and now - self.rebuilt_at < rebuild_every
+        ):
+            return
+
+        with self.lock, metrics.housekeeping():
+            started = timezone.now()
+            if self.filter is None or now - self.rebuilt_at >= rebuild_every:
+                TokenRevocation.objects.filter(expires_at__lte=started).delete()
+                self.filter = BloomFilter()
+                self.rebuilt_at = now
+                rows = TokenRevocation.objects.all()
+            else:
+                # Overlap the previous window so rows committed late are not missed.
+                rows = TokenRevocation.objects.filter(
+                    created_at__gte=self.synced_until - timedelta(seconds=refresh_every)
+                )
+            for jti in rows.values_list('jti', flat=True).iterator(chunk_size=2000):
+                self.filter.add(jti)
+            self.synced_until = started
+            self.refreshed_at = now
+
+
+revocations = RevocationFilter()
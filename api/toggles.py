@@ -0,0 +1,137 @@
+"""
+Race-free like and subscription toggles.
+
+Checking for an existing row before inserting one lets two concurrent
+requests (a double tap, a retried request) both pass the check, and the
+second insert then fails on the unique constraint. Instead the row is
+inserted with ``INSERT ... ON CONFLICT DO NOTHING`` and removed with a
+single DELETE, and the number of rows the statement touched decides the
+response. Counters are only adjusted when a row was actually inserted or
+deleted, so they move exactly once per row however requests interleave.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import counters, feed, response_cache
+from api.models import Like, Member, Post, Subscription
+
+
+def insert_ignore(model, **values):
+    """
+    Insert one row of ``model`` unless it conflicts with a unique constraint.
+    ``values`` are keyed by field name or attname (``user_id``). Returns the
+    new primary key, or None when a conflicting row already exists.
+    """
+    fields = [model._meta.get_field(name) for name in values]
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT DO NOTHING'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    params = [field.get_db_prep_save(value, connection) for field, value in zip(fields, values.values())]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.lastrowid if cursor.rowcount == 1 else None
+
+
+def insert_ignore_many(model, rows, returning):
+    """
+    ``insert_ignore`` for several rows in one statement. ``rows`` are dicts
+    with the same keys. Returns a tuple of the ``returning`` fields for each
+    row that was inserted; rows that conflicted are left out.
+    """
+    if not rows:
+        return []
+    names = list(rows[0])
+    fields = [model._meta.get_field(name) for name in names]
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING RETURNING {}'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['({})'.format(', '.join(['%s'] * len(fields)))] * len(rows)),
+        ', '.join(quote(model._meta.get_field(name).column) for name in returning),
+    )
+    params = [field.get_db_prep_save(row[name], connection) for row in rows for name, field in zip(names, fields)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def delete_returning(model, returning, **filters):
+    """
+    Delete the rows of ``model`` matching ``filters`` (``field=value`` or
+    ``field__in=values``) in one statement and return a tuple of the
+    ``returning`` fields for each row that was deleted.
+    """
+    quote = connection.ops.quote_name
+    conditions, params = [], []
+    for lookup, value in filters.items():
+        name, _, operator = lookup.partition('__')
+        field = model._meta.get_field(name)
+        values = list(value) if operator == 'in' else [value]
+        placeholders = ', '.join(['%s'] * len(values))
+        conditions.append(f'{quote(field.column)} IN ({placeholders})' if operator == 'in' else f'{quote(field.column)} = %s')
+        params.extend(field.get_db_prep_value(value, connection) for value in values)
+    sql = 'DELETE FROM {} WHERE {} RETURNING {}'.format(
+        quote(model._meta.db_table),
+        ' AND '.join(conditions),
+        ', '.join(quote(model._meta.get_field(name).column) for name in returning),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _likes_count(post_id):
+    return Post.objects.values_list('likes_count', flat=True).get(id=post_id)
+
+
+def like(member_id, post):
+    """
+    Like ``post`` (which needs ``id`` and ``author_id``). Returns the new
+    likes count, or None if the member already liked it.
+    """
+    with transaction.atomic():
+        if insert_ignore(Like, user_id=member_id, post_id=post.id, created_at=timezone.now()) is None:
+            return None
+        counters.adjust(Post, post.id, likes_count=1)
+        response_cache.posts_changed(post.author_id)
+        return _likes_count(post.id)
+
+
+def unlike(member_id, post):
+    """Remove the member's like of ``post``; returns the new likes count, or None if there was none."""
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(user_id=member_id, post_id=post.id).delete()
+        if not deleted:
+            return None
+        counters.adjust(Post, post.id, likes_count=-1)
+        response_cache.posts_changed(post.author_id)
+        return _likes_count(post.id)
+
+
+def subscribe(member, target):
+    """Subscribe ``member`` to ``target``; returns the new ``Subscription``, or None if it already existed."""
+    created_at = timezone.now()
+    with transaction.atomic():
+        pk = insert_ignore(Subscription, subscriber_id=member.id, target_id=target.id, created_at=created_at)
+        if pk is None:
+            return None
+        counters.adjust(Member, target.id, followers_count=1)
+        counters.adjust(Member, member.id, following_count=1)
+        feed.backfill(member.id, target.id)
+    return Subscription(id=pk, subscriber=member, target=target, created_at=created_at)
+
+
+def unsubscribe(member_id, target_id):
+    """Remove the subscription; returns whether there was one."""
+    with transaction.atomic():
+        deleted, _ = Subscription.objects.filter(subscriber_id=member_id, target_id=target_id).delete()
+        if not deleted:
+            return False
+        counters.adjust(Member, target_id, followers_count=-1)
+        counters.adjust(Member, member_id, following_count=-1)
+        feed.prune(member_id, target_id)
+        feed.catch_up(target_id)
+    return True
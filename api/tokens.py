@@ -30,3 +30,19 @@ class Token(models.Model):
 
     def __str__(self):
         return self.key
+
+
+class TokenRevocation(models.Model):
+    """
+    A revoked signed token, kept until the token would have expired anyway.
+    """
+    jti = models.CharField(max_length=32, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'token_revocations'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.jti
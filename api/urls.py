@@ -5,11 +5,15 @@ from api.views import (
     LoginView,
     LogoutView,
     MeView,
+    ExportView,
     ChangePasswordView,
+    HeartbeatView,
     UserListView,
     UserDetailView,
     UserSearchView,
     PostListCreateView,
+    PostSearchView,
+    FeedView,
     PostDetailView,
     UserPostsView,
     LikeView,
@@ -21,6 +25,8 @@ from api.views import (
     DialogListView,
     DialogMessagesView,
     MessageDeleteView,
+    MessageWaitView,
+    BatchView,
 )
 
 urlpatterns = [
@@ -31,8 +37,12 @@ urlpatterns = [
     path("auth/login", LoginView.as_view(), name="login"),
     path("auth/logout", LogoutView.as_view(), name="logout"),
     path("auth/me", MeView.as_view(), name="me"),
+    path("auth/me/export", ExportView.as_view(), name="me-export"),
     path("auth/change-password", ChangePasswordView.as_view(), name="change-password"),
     
+    # Presence endpoints
+    path("presence/heartbeat", HeartbeatView.as_view(), name="presence-heartbeat"),
+    
     # User endpoints
     path("users", UserListView.as_view(), name="user-list"),
     path("users/search", UserSearchView.as_view(), name="user-search"),
@@ -44,8 +54,12 @@ urlpatterns = [
     path("users/<int:id>/subscribers", SubscribersListView.as_view(), name="user-subscribers"),
     path("users/<int:id>/subscriptions", SubscriptionsListView.as_view(), name="user-subscriptions"),
     
+    # Feed endpoints
+    path("feed", FeedView.as_view(), name="feed"),
+    
     # Post endpoints
     path("posts", PostListCreateView.as_view(), name="post-list-create"),
+    path("posts/search", PostSearchView.as_view(), name="post-search"),
     path("posts/<int:id>", PostDetailView.as_view(), name="post-detail"),
     path("posts/<int:id>/like", LikeView.as_view(), name="post-like"),
     path("posts/<int:id>/comments", CommentListCreateView.as_view(), name="post-comments"),
@@ -56,5 +70,9 @@ urlpatterns = [
     # Dialog and message endpoints
     path("dialogs", DialogListView.as_view(), name="dialog-list"),
     path("dialogs/<int:user_id>", DialogMessagesView.as_view(), name="dialog-messages"),
+    path("messages/wait", MessageWaitView.as_view(), name="message-wait"),
     path("messages/<int:id>", MessageDeleteView.as_view(), name="message-delete"),
+
+    # Batched writes
+    path("batch", BatchView.as_view(), name="batch"),
 ]
\ No newline at end of file
@@ -1,15 +1,30 @@
+import asyncio
+from functools import partial
+
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q, Count, Max, Prefetch, Subquery, OuterRef
-from drf_spectacular.utils import extend_schema
+from django.views import View
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 
-from api.models import Member, Post, Like, Comment, Subscription, Message
+from api.models import Member, Post, Comment, Subscription, Message, Conversation
 from api.tokens import Token
 from api.authentication import TokenAuthentication
+from api import (
+    batch, conditional, conversations, counters, export, feed, fieldsets, images, multiget, notify, presence,
+    response_cache, rows, search, signed_tokens, toggles,
+)
+from api.fieldsets import FIELDSET_PARAMETERS
+from api.pagination import CURSOR_PARAMETERS, StandardResultsSetPagination, paginator_for
 from api.serializers import (
     MemberSerializer,
     MemberRegistrationSerializer,
@@ -18,6 +33,7 @@ from api.serializers import (
     MessageSerializer,
     MessageCreateSerializer,
     PostSerializer,
+    PostSearchResultSerializer,
     PostCreateSerializer,
     CommentSerializer,
     CommentCreateSerializer,
@@ -25,13 +41,17 @@ from api.serializers import (
     DialogSerializer,
     MemberShortSerializer,
     ChangePasswordSerializer,
+    BatchSerializer,
+    BatchResultSerializer,
 )
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+def issue_token(member):
+    """Create an auth token in the format selected by AUTH_TOKEN_FORMAT."""
+    if settings.AUTH_TOKEN_FORMAT == 'signed':
+        return signed_tokens.issue(member)
+    token, created = Token.objects.get_or_create(user=member)
+    return token.key
 
 
 class RegisterView(APIView):
@@ -39,6 +59,7 @@ class RegisterView(APIView):
     Register a new user account.
     """
     permission_classes = [AllowAny]
+    query_budget = {'post': 3}
 
     @extend_schema(
         request=MemberRegistrationSerializer,
@@ -59,6 +80,7 @@ class LoginView(APIView):
     Authenticate user and create session token.
     """
     permission_classes = [AllowAny]
+    query_budget = {'post': 4}
 
     @extend_schema(
         request=MemberLoginSerializer,
@@ -88,16 +110,11 @@ class LoginView(APIView):
             )
 
         # Update online status
-        member.is_online = True
-        member.last_seen = timezone.now()
-        member.save()
-
-        # Create or get token
-        token, created = Token.objects.get_or_create(user=member)
+        presence.mark_online(member)
 
         response_serializer = MemberSerializer(member)
         response_data = response_serializer.data
-        response_data['token'] = token.key
+        response_data['token'] = issue_token(member)
 
         return Response(response_data, status=status.HTTP_200_OK)
 
@@ -108,46 +125,112 @@ class LogoutView(APIView):
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'post': 3}
 
     @extend_schema(
         responses={200: dict, 401: dict},
         description="Terminate user session"
     )
     def post(self, request):
-        # Delete token
-        if hasattr(request.user, 'auth_token'):
+        # Revoke or delete token
+        if isinstance(request.auth, signed_tokens.SignedToken):
+            signed_tokens.revoke(request.auth)
+        elif hasattr(request.user, 'auth_token'):
             request.user.auth_token.delete()
 
         # Update online status
-        request.user.is_online = False
-        request.user.last_seen = timezone.now()
-        request.user.save()
+        presence.mark_offline(request.user)
 
         return Response({"message": "Successfully logged out"}, status=status.HTTP_200_OK)
 
 
+class HeartbeatView(APIView):
+    """
+    Report that the current user is active.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = {'post': 1}
+
+    @extend_schema(
+        request=None,
+        responses={204: None, 401: dict},
+        description="Refresh online presence of the authenticated user"
+    )
+    def post(self, request):
+        # Authentication already buffered the heartbeat; only a member who
+        # logged out on another token needs the online flag set again.
+        if not request.user.is_online:
+            presence.mark_online(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class MeView(APIView):
     """
     Get current authenticated user information.
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 1}
 
     @extend_schema(
         responses={200: MemberSerializer, 401: dict},
+        parameters=FIELDSET_PARAMETERS,
         description="Retrieve currently authenticated user information"
     )
     def get(self, request):
-        serializer = MemberSerializer(request.user)
+        fieldset = fieldsets.parse(request, fieldsets.MEMBER)
+        serializer = MemberSerializer(request.user, context={'fieldset': fieldset})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class ExportView(APIView):
+    """
+    Download everything the current user has created or received.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    # Only authentication runs before the response starts; the export
+    # queries run while it streams.
+    query_budget = {'get': 1}
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='type',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description="ndjson (default) or zip",
+                required=False,
+                enum=list(export.CONTENT_TYPES),
+            ),
+        ],
+        responses={200: OpenApiTypes.BINARY, 400: dict, 401: dict},
+        description="Stream the user's profile, posts, comments, likes, subscriptions and messages"
+    )
+    def get(self, request):
+        export_type = request.query_params.get('type', 'ndjson')
+        if export_type not in export.CONTENT_TYPES:
+            return Response(
+                {"error": "Invalid type", "detail": "Export type must be ndjson or zip"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        response = StreamingHttpResponse(
+            export.stream(request.user, export_type),
+            content_type=export.CONTENT_TYPES[export_type],
+        )
+        response['Content-Disposition'] = export.content_disposition(request.user, export_type)
+        return response
+
+
 class ChangePasswordView(APIView):
     """
     Change user password.
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'post': 3}
 
     @extend_schema(
         request=ChangePasswordSerializer,
@@ -171,7 +254,13 @@ class ChangePasswordView(APIView):
         request.user.set_password(new_password)
         request.user.save()
 
-        return Response({"message": "Password successfully changed"}, status=status.HTTP_200_OK)
+        response_data = {"message": "Password successfully changed"}
+        # The new password hash invalidates every signed token of this user,
+        # including the one used for this request, so hand out a fresh one.
+        if isinstance(request.auth, signed_tokens.SignedToken):
+            response_data['token'] = issue_token(request.user)
+
+        return Response(response_data, status=status.HTTP_200_OK)
 
 
 class UserListView(APIView):
@@ -181,16 +270,25 @@ class UserListView(APIView):
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    query_budget = {'get': 3}
 
     @extend_schema(
         responses={200: MemberSerializer(many=True), 401: dict},
-        description="Retrieve paginated list of all users"
+        parameters=CURSOR_PARAMETERS + FIELDSET_PARAMETERS + [multiget.IDS_PARAMETER],
+        description="Retrieve paginated list of all users, or the users with the given ids"
     )
     def get(self, request):
-        queryset = Member.objects.all().order_by('-created_at')
-        paginator = self.pagination_class()
+        fieldset = fieldsets.parse(request, fieldsets.MEMBER)
+        ids = multiget.requested_ids(request)
+        if ids is not None:
+            members = list(fieldset.restrict(Member.objects.filter(id__in=ids).order_by()))
+            serializer = MemberSerializer(members, many=True, context={'fieldset': fieldset})
+            return Response(multiget.keyed(ids, [member.id for member in members], serializer.data))
+
+        queryset = fieldset.restrict(Member.objects.all(), 'created_at').order_by('-created_at')
+        paginator = paginator_for(request, self.pagination_class)
         paginated_queryset = paginator.paginate_queryset(queryset, request)
-        serializer = MemberSerializer(paginated_queryset, many=True)
+        serializer = MemberSerializer(paginated_queryset, many=True, context={'fieldset': fieldset})
         return paginator.get_paginated_response(serializer.data)
 
 
@@ -200,22 +298,31 @@ class UserDetailView(APIView):
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 2, 'patch': 3}
 
     @extend_schema(
-        responses={200: MemberSerializer, 404: dict, 401: dict},
+        responses={200: MemberSerializer, 304: None, 404: dict, 401: dict},
+        parameters=FIELDSET_PARAMETERS,
         description="Retrieve specific user profile by ID"
     )
     def get(self, request, id):
+        fieldset = fieldsets.parse(request, fieldsets.MEMBER)
         try:
-            member = Member.objects.get(id=id)
+            member = fieldset.restrict(Member.objects.all(), 'updated_at', 'is_online', 'last_seen').get(id=id)
         except Member.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "User not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        serializer = MemberSerializer(member)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        last_seen = presence.last_seen(member)
+        etag = conditional.etag(member.id, member.updated_at, presence.is_online(member), last_seen)
+        last_modified = conditional.latest(member.updated_at, last_seen)
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is None:
+            serializer = MemberSerializer(member, context={'fieldset': fieldset})
+            response = Response(serializer.data, status=status.HTTP_200_OK)
+        return conditional.with_validators(response, etag, last_modified)
 
     @extend_schema(
         request=MemberUpdateSerializer,
@@ -240,7 +347,15 @@ class UserDetailView(APIView):
 
         serializer = MemberUpdateSerializer(member, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                if 'avatar' in serializer.validated_data:
+                    # The previous avatar and its variants no longer apply.
+                    images.discard(member, 'avatar')
+                    serializer.save(avatar_variants={})
+                    images.schedule(member, 'avatar')
+                else:
+                    serializer.save()
+                response_cache.posts_changed(member.id)
             response_serializer = MemberSerializer(member)
             return Response(response_serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -249,17 +364,23 @@ class UserDetailView(APIView):
 class UserSearchView(APIView):
     """
     Search users by username, first name, or last name.
+    On SQLite, queries of three or more characters use the members_fts
+    trigram index and are ordered by relevance.
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    query_budget = {'get': 5}
 
     @extend_schema(
         responses={200: MemberSerializer(many=True), 400: dict, 401: dict},
+        parameters=FIELDSET_PARAMETERS,
         description="Search users by username, first name, or last name"
     )
     def get(self, request):
         query = request.query_params.get('q', '')
+        fieldset = fieldsets.parse(request, fieldsets.MEMBER)
+        members = fieldset.restrict(Member.objects.all(), 'created_at')
         
         if not query:
             return Response(
@@ -267,15 +388,19 @@ class UserSearchView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        queryset = Member.objects.filter(
-            Q(username__icontains=query) |
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query)
-        ).order_by('-created_at')
+        if len(query) >= search.TRIGRAM_MIN_LENGTH and search.fts_available(search.MEMBER_SEARCH_TABLE):
+            # Ranked lookup through the trigram index
+            queryset = search.RankedResults(members, search.MEMBER_SEARCH_TABLE, search.phrase(query))
+        else:
+            queryset = members.filter(
+                Q(username__icontains=query) |
+                Q(first_name__icontains=query) |
+                Q(last_name__icontains=query)
+            ).order_by('-created_at')
 
         paginator = self.pagination_class()
         paginated_queryset = paginator.paginate_queryset(queryset, request)
-        serializer = MemberSerializer(paginated_queryset, many=True)
+        serializer = MemberSerializer(paginated_queryset, many=True, context={'fieldset': fieldset})
         return paginator.get_paginated_response(serializer.data)
 
 
@@ -285,6 +410,7 @@ class PostListCreateView(APIView):
     """
     authentication_classes = [TokenAuthentication]
     pagination_class = StandardResultsSetPagination
+    query_budget = {'get': 3, 'post': 7}
 
     def get_permissions(self):
         if self.request.method == 'POST':
@@ -293,14 +419,25 @@ class PostListCreateView(APIView):
 
     @extend_schema(
         responses={200: PostSerializer(many=True)},
-        description="Retrieve paginated list of all posts sorted by date"
+        parameters=CURSOR_PARAMETERS + FIELDSET_PARAMETERS + [multiget.IDS_PARAMETER],
+        description="Retrieve paginated list of all posts sorted by date, or the posts with the given ids"
     )
     def get(self, request):
-        queryset = Post.objects.all().order_by('-created_at')
-        paginator = self.pagination_class()
-        paginated_queryset = paginator.paginate_queryset(queryset, request)
-        serializer = PostSerializer(paginated_queryset, many=True, context={'request': request})
-        return paginator.get_paginated_response(serializer.data)
+        fieldset = fieldsets.parse(request, fieldsets.POST)
+        ids = multiget.requested_ids(request)
+        if ids is not None:
+            posts = Post.objects.for_listing(request.user).filter(id__in=ids).order_by()
+            found = list(posts.values(*fieldset.lookups('id')))
+            data = rows.render(found, fieldset, request)
+            return Response(multiget.keyed(ids, [row['id'] for row in found], data))
+
+        def build():
+            queryset = Post.objects.for_listing(request.user).order_by('-created_at')
+            paginator = paginator_for(request, self.pagination_class)
+            page = paginator.paginate_queryset(queryset.values(*fieldset.lookups('id', 'created_at')), request)
+            return paginator.get_paginated_response(rows.render(page, fieldset, request))
+
+        return response_cache.respond(request, 'post-list-create', response_cache.GLOBAL_SCOPE, build)
 
     @extend_schema(
         request=PostCreateSerializer,
@@ -310,17 +447,91 @@ class PostListCreateView(APIView):
     def post(self, request):
         serializer = PostCreateSerializer(data=request.data)
         if serializer.is_valid():
-            post = serializer.save(author=request.user)
+            with transaction.atomic():
+                post = serializer.save(author=request.user)
+                counters.adjust(Member, request.user.id, posts_count=1)
+                feed.fan_out_post(post)
+                images.schedule(post, 'image')
+                response_cache.posts_changed(request.user.id)
+            post = Post.objects.for_listing(request.user).get(id=post.id)
             response_serializer = PostSerializer(post, context={'request': request})
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class PostSearchView(APIView):
+    """
+    Full-text search over post content.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [AllowAny]
+    pagination_class = StandardResultsSetPagination
+    query_budget = {'get': 5}
+
+    @extend_schema(
+        responses={200: PostSearchResultSerializer(many=True), 400: dict},
+        parameters=FIELDSET_PARAMETERS,
+        description="Search posts by content, best matches first, with highlighted snippets"
+    )
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        match = search.all_words(query)
+        fieldset = fieldsets.parse(request, fieldsets.POST_SEARCH_RESULT)
+
+        if not match:
+            return Response(
+                {"error": "Invalid search query", "detail": "Search query parameter 'q' is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        posts = fieldset.restrict(Post.objects.for_listing(request.user), 'created_at')
+        if search.fts_available(search.POST_SEARCH_TABLE):
+            queryset = search.RankedResults(
+                posts,
+                search.POST_SEARCH_TABLE,
+                match,
+                rank=f'bm25({search.POST_SEARCH_TABLE})',
+                columns={'search_snippet': search.POST_SNIPPET},
+            )
+        else:
+            queryset = posts.filter(content__icontains=query).order_by('-created_at')
+
+        paginator = self.pagination_class()
+        paginated_queryset = paginator.paginate_queryset(queryset, request)
+        serializer = PostSearchResultSerializer(
+            paginated_queryset, many=True, context={'request': request, 'fieldset': fieldset},
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+
+class FeedView(APIView):
+    """
+    Get personalized feed of posts from followed users.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+    query_budget = {'get': 4}
+
+    @extend_schema(
+        responses={200: PostSerializer(many=True), 401: dict},
+        parameters=CURSOR_PARAMETERS + FIELDSET_PARAMETERS,
+        description="Retrieve paginated feed of own posts and posts from followed users"
+    )
+    def get(self, request):
+        fieldset = fieldsets.parse(request, fieldsets.POST)
+        queryset = feed.feed_queryset(request.user).for_listing(request.user).order_by('-created_at')
+        paginator = paginator_for(request, self.pagination_class)
+        page = paginator.paginate_queryset(queryset.values(*fieldset.lookups('id', 'created_at')), request)
+        return paginator.get_paginated_response(rows.render(page, fieldset, request))
+
+
 class PostDetailView(APIView):
     """
     Get or delete specific post.
     """
     authentication_classes = [TokenAuthentication]
+    query_budget = {'get': 2, 'delete': 7}
 
     def get_permissions(self):
         if self.request.method == 'DELETE':
@@ -328,20 +539,35 @@ class PostDetailView(APIView):
         return [AllowAny()]
 
     @extend_schema(
-        responses={200: PostSerializer, 404: dict},
+        responses={200: PostSerializer, 304: None, 404: dict},
+        parameters=FIELDSET_PARAMETERS,
         description="Retrieve specific post by ID"
     )
     def get(self, request, id):
+        fieldset = fieldsets.parse(request, fieldsets.POST)
+        # The validators read the author whether or not it is rendered.
+        posts = fieldset.restrict(
+            Post.objects.for_listing(request.user),
+            'updated_at', 'author__updated_at', 'author__is_online', 'author__last_seen',
+        )
         try:
-            post = Post.objects.get(id=id)
+            post = posts.get(id=id)
         except Post.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "Post not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        serializer = PostSerializer(post, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        author = post.author
+        etag = conditional.etag(
+            post.id, post.updated_at, post.is_liked, author.updated_at, presence.is_online(author),
+        )
+        last_modified = conditional.latest(post.updated_at, author.updated_at)
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is None:
+            serializer = PostSerializer(post, context={'request': request, 'fieldset': fieldset})
+            response = Response(serializer.data, status=status.HTTP_200_OK)
+        return conditional.with_validators(response, etag, last_modified)
 
     @extend_schema(
         responses={204: None, 403: dict, 404: dict, 401: dict},
@@ -357,13 +583,16 @@ class PostDetailView(APIView):
             )
 
         # Check if user is the author
-        if request.user.id != post.author.id:
+        if request.user.id != post.author_id:
             return Response(
                 {"error": "Permission denied", "detail": "You can only delete your own posts"},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        post.delete()
+        with transaction.atomic():
+            post.delete()
+            counters.adjust(Member, post.author_id, posts_count=-1)
+            response_cache.posts_changed(post.author_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -373,25 +602,42 @@ class UserPostsView(APIView):
     """
     permission_classes = [AllowAny]
     pagination_class = StandardResultsSetPagination
+    query_budget = {'get': 4}
 
     @extend_schema(
-        responses={200: PostSerializer(many=True), 404: dict},
+        responses={200: PostSerializer(many=True), 304: None, 404: dict},
+        parameters=CURSOR_PARAMETERS + FIELDSET_PARAMETERS,
         description="Retrieve paginated list of posts by specific user"
     )
     def get(self, request, id):
+        fieldset = fieldsets.parse(request, fieldsets.POST)
         try:
-            user = Member.objects.get(id=id)
+            user = Member.objects.only('id', 'updated_at', 'is_online', 'last_seen').get(id=id)
         except Member.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "User not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        queryset = Post.objects.filter(author=user).order_by('-created_at')
-        paginator = self.pagination_class()
-        paginated_queryset = paginator.paginate_queryset(queryset, request)
-        serializer = PostSerializer(paginated_queryset, many=True, context={'request': request})
-        return paginator.get_paginated_response(serializer.data)
+        # Likes, comments and new posts bump a post's updated_at, deletions
+        # bump the author's posts_count; together they version every page.
+        newest = Post.objects.filter(author=user).aggregate(newest=Max('updated_at'))['newest']
+        etag = conditional.etag(
+            user.id, user.updated_at, presence.is_online(user), newest, conditional.viewer_id(request),
+        )
+        last_modified = conditional.latest(user.updated_at, newest)
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is not None:
+            return conditional.with_validators(response, etag, last_modified)
+
+        def build():
+            queryset = Post.objects.for_listing(request.user).filter(author=user).order_by('-created_at')
+            paginator = paginator_for(request, self.pagination_class)
+            page = paginator.paginate_queryset(queryset.values(*fieldset.lookups('id', 'created_at')), request)
+            return paginator.get_paginated_response(rows.render(page, fieldset, request))
+
+        response = response_cache.respond(request, 'user-posts', response_cache.author_scope(user.id), build)
+        return conditional.with_validators(response, etag, last_modified)
 
 
 class LikeView(APIView):
@@ -400,6 +646,7 @@ class LikeView(APIView):
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'post': 5, 'delete': 5}
 
     @extend_schema(
         responses={201: dict, 400: dict, 404: dict, 401: dict},
@@ -407,23 +654,20 @@ class LikeView(APIView):
     )
     def post(self, request, id):
         try:
-            post = Post.objects.get(id=id)
+            post = Post.objects.only('id', 'author_id').get(id=id)
         except Post.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "Post not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Check if already liked
-        if Like.objects.filter(user=request.user, post=post).exists():
+        likes_count = toggles.like(request.user.id, post)
+        if likes_count is None:
             return Response(
                 {"error": "Already liked", "detail": "You have already liked this post"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        Like.objects.create(user=request.user, post=post)
-        likes_count = post.likes.count()
-
         return Response(
             {"message": "Post liked successfully", "likes_count": likes_count},
             status=status.HTTP_201_CREATED
@@ -435,24 +679,20 @@ class LikeView(APIView):
     )
     def delete(self, request, id):
         try:
-            post = Post.objects.get(id=id)
+            post = Post.objects.only('id', 'author_id').get(id=id)
         except Post.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "Post not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        try:
-            like = Like.objects.get(user=request.user, post=post)
-        except Like.DoesNotExist:
+        likes_count = toggles.unlike(request.user.id, post)
+        if likes_count is None:
             return Response(
                 {"error": "Not liked yet", "detail": "You have not liked this post yet"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        like.delete()
-        likes_count = post.likes.count()
-
         return Response(
             {"message": "Post unliked successfully", "likes_count": likes_count},
             status=status.HTTP_200_OK
@@ -465,6 +705,7 @@ class CommentListCreateView(APIView):
     """
     authentication_classes = [TokenAuthentication]
     pagination_class = StandardResultsSetPagination
+    query_budget = {'get': 4, 'post': 4}
 
     def get_permissions(self):
         if self.request.method == 'POST':
@@ -472,23 +713,41 @@ class CommentListCreateView(APIView):
         return [AllowAny()]
 
     @extend_schema(
-        responses={200: CommentSerializer(many=True), 404: dict},
+        responses={200: CommentSerializer(many=True), 304: None, 404: dict},
+        parameters=CURSOR_PARAMETERS + FIELDSET_PARAMETERS,
         description="Retrieve paginated list of comments for specific post"
     )
     def get(self, request, id):
+        fieldset = fieldsets.parse(request, fieldsets.COMMENT)
         try:
-            post = Post.objects.get(id=id)
+            post = Post.objects.only('id', 'updated_at').get(id=id)
         except Post.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "Post not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        queryset = Comment.objects.filter(post=post).order_by('-created_at')
-        paginator = self.pagination_class()
-        paginated_queryset = paginator.paginate_queryset(queryset, request)
-        serializer = CommentSerializer(paginated_queryset, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        queryset = Comment.objects.filter(post=post).order_by('-created_at').values(*fieldset.lookups(
+            'id', 'created_at', 'author__id', 'author__updated_at', 'author__is_online', 'author__last_seen',
+        ))
+        paginator = paginator_for(request, self.pagination_class)
+        page = paginator.paginate_queryset(queryset, request)
+
+        # New and deleted comments bump the post's comments_count, so its
+        # updated_at versions the page; the authors are embedded per row.
+        cutoff = presence.online_cutoff()
+        etag = conditional.etag(
+            post.id, post.updated_at,
+            [(row['id'], row['author__updated_at'],
+              presence.online(row['author__id'], row['author__is_online'], row['author__last_seen'], cutoff))
+             for row in page],
+        )
+        last_modified = conditional.latest(post.updated_at, *(row['author__updated_at'] for row in page))
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is None:
+            # CommentSerializer is rendered without a request, so URLs stay relative.
+            response = paginator.get_paginated_response(rows.render(page, fieldset))
+        return conditional.with_validators(response, etag, last_modified)
 
     @extend_schema(
         request=CommentCreateSerializer,
@@ -506,7 +765,10 @@ class CommentListCreateView(APIView):
 
         serializer = CommentCreateSerializer(data=request.data)
         if serializer.is_valid():
-            comment = serializer.save(author=request.user, post=post)
+            with transaction.atomic():
+                comment = serializer.save(author=request.user, post=post)
+                counters.adjust(Post, post.id, comments_count=1)
+                response_cache.posts_changed(post.author_id)
             response_serializer = CommentSerializer(comment)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -518,6 +780,7 @@ class CommentDeleteView(APIView):
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'delete': 4}
 
     @extend_schema(
         responses={204: None, 403: dict, 404: dict, 401: dict},
@@ -525,7 +788,7 @@ class CommentDeleteView(APIView):
     )
     def delete(self, request, id):
         try:
-            comment = Comment.objects.get(id=id)
+            comment = Comment.objects.select_related('post').get(id=id)
         except Comment.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "Comment not found"},
@@ -533,13 +796,16 @@ class CommentDeleteView(APIView):
             )
 
         # Check if user is the author
-        if request.user.id != comment.author.id:
+        if request.user.id != comment.author_id:
             return Response(
                 {"error": "Permission denied", "detail": "You can only delete your own comments"},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        comment.delete()
+        with transaction.atomic():
+            comment.delete()
+            counters.adjust(Post, comment.post_id, comments_count=-1)
+            response_cache.posts_changed(comment.post.author_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -549,6 +815,9 @@ class SubscribeView(APIView):
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    # Unsubscribing reads the target's follower count back to tell whether
+    # they just dropped below the fan-out threshold (feed.catch_up).
+    query_budget = {'post': 8, 'delete': 7}
 
     @extend_schema(
         responses={201: dict, 400: dict, 404: dict, 401: dict},
@@ -556,7 +825,7 @@ class SubscribeView(APIView):
     )
     def post(self, request, id):
         try:
-            target_user = Member.objects.get(id=id)
+            target_user = Member.objects.only('id').get(id=id)
         except Member.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "User not found"},
@@ -570,14 +839,12 @@ class SubscribeView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Check if already subscribed
-        if Subscription.objects.filter(subscriber=request.user, target=target_user).exists():
+        subscription = toggles.subscribe(request.user, target_user)
+        if subscription is None:
             return Response(
                 {"error": "Already subscribed", "detail": "You are already subscribed to this user"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        subscription = Subscription.objects.create(subscriber=request.user, target=target_user)
         serializer = SubscriptionSerializer(subscription)
 
         return Response(
@@ -594,23 +861,19 @@ class SubscribeView(APIView):
     )
     def delete(self, request, id):
         try:
-            target_user = Member.objects.get(id=id)
+            target_user = Member.objects.only('id').get(id=id)
         except Member.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "User not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        try:
-            subscription = Subscription.objects.get(subscriber=request.user, target=target_user)
-        except Subscription.DoesNotExist:
+        if not toggles.unsubscribe(request.user.id, target_user.id):
             return Response(
                 {"error": "Not found", "detail": "Subscription not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        subscription.delete()
-
         return Response(
             {"message": "Successfully unsubscribed"},
             status=status.HTTP_200_OK
@@ -624,27 +887,33 @@ class SubscribersListView(APIView):
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    query_budget = {'get': 4}
 
     @extend_schema(
         responses={200: MemberSerializer(many=True), 404: dict, 401: dict},
+        parameters=CURSOR_PARAMETERS + FIELDSET_PARAMETERS,
         description="Retrieve paginated list of user subscribers"
     )
     def get(self, request, id):
+        fieldset = fieldsets.parse(request, fieldsets.MEMBER)
         try:
-            user = Member.objects.get(id=id)
+            user = Member.objects.only('id').get(id=id)
         except Member.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "User not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Get subscribers (users who subscribed to this user)
-        subscriber_ids = Subscription.objects.filter(target=user).values_list('subscriber', flat=True)
-        queryset = Member.objects.filter(id__in=subscriber_ids).order_by('-created_at')
+        # Get subscribers (users who subscribed to this user), newest first
+        queryset = (
+            Subscription.objects.filter(target=user)
+            .order_by('-created_at', '-id')
+        )
+        queryset = fieldset.restrict(queryset, 'created_at', prefix='subscriber__')
 
-        paginator = self.pagination_class()
-        paginated_queryset = paginator.paginate_queryset(queryset, request)
-        serializer = MemberSerializer(paginated_queryset, many=True)
+        paginator = paginator_for(request, self.pagination_class)
+        page = paginator.paginate_queryset(queryset, request)
+        serializer = MemberSerializer([s.subscriber for s in page], many=True, context={'fieldset': fieldset})
         return paginator.get_paginated_response(serializer.data)
 
 
@@ -655,27 +924,33 @@ class SubscriptionsListView(APIView):
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    query_budget = {'get': 4}
 
     @extend_schema(
         responses={200: MemberSerializer(many=True), 404: dict, 401: dict},
+        parameters=CURSOR_PARAMETERS + FIELDSET_PARAMETERS,
         description="Retrieve paginated list of user subscriptions"
     )
     def get(self, request, id):
+        fieldset = fieldsets.parse(request, fieldsets.MEMBER)
         try:
-            user = Member.objects.get(id=id)
+            user = Member.objects.only('id').get(id=id)
         except Member.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "User not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Get subscriptions (users this user is subscribed to)
-        subscription_ids = Subscription.objects.filter(subscriber=user).values_list('target', flat=True)
-        queryset = Member.objects.filter(id__in=subscription_ids).order_by('-created_at')
+        # Get subscriptions (users this user is subscribed to), newest first
+        queryset = (
+            Subscription.objects.filter(subscriber=user)
+            .order_by('-created_at', '-id')
+        )
+        queryset = fieldset.restrict(queryset, 'created_at', prefix='target__')
 
-        paginator = self.pagination_class()
-        paginated_queryset = paginator.paginate_queryset(queryset, request)
-        serializer = MemberSerializer(paginated_queryset, many=True)
+        paginator = paginator_for(request, self.pagination_class)
+        page = paginator.paginate_queryset(queryset, request)
+        serializer = MemberSerializer([s.target for s in page], many=True, context={'fieldset': fieldset})
         return paginator.get_paginated_response(serializer.data)
 
 
@@ -686,60 +961,30 @@ class DialogListView(APIView):
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    query_budget = {'get': 3}
 
     @extend_schema(
         responses={200: DialogSerializer(many=True), 401: dict},
         description="Retrieve paginated list of dialogs with last message and unread count"
     )
     def get(self, request):
-        user = request.user
-
-        # Get all users with whom current user has messages
-        participants_sent = Message.objects.filter(sender=user).values_list('receiver', flat=True).distinct()
-        participants_received = Message.objects.filter(receiver=user).values_list('sender', flat=True).distinct()
-        participant_ids = set(list(participants_sent) + list(participants_received))
-
-        dialogs = []
-        for participant_id in participant_ids:
-            participant = Member.objects.get(id=participant_id)
-            
-            # Get last message
-            last_message = Message.objects.filter(
-                Q(sender=user, receiver=participant) | Q(sender=participant, receiver=user)
-            ).order_by('-created_at').first()
-            
-            # Count unread messages from this participant
-            unread_count = Message.objects.filter(
-                sender=participant,
-                receiver=user,
-                is_read=False
-            ).count()
-            
-            dialogs.append({
-                'id': participant.id,
-                'participant': participant,
-                'last_message': last_message,
-                'unread_count': unread_count,
-                'last_message_time': last_message.created_at if last_message else None
-            })
-        
-        # Sort by last message time
-        dialogs.sort(key=lambda x: x['last_message_time'] if x['last_message_time'] else timezone.datetime.min.replace(tzinfo=timezone.utc), reverse=True)
-        
-        # Prepare for pagination
+        queryset = (
+            Conversation.objects.filter(owner=request.user)
+            .select_related('participant', 'last_message')
+            .order_by('-last_message_at', '-id')
+        )
         paginator = self.pagination_class()
-        page = paginator.paginate_queryset(dialogs, request)
-        
-        # Serialize
+        page = paginator.paginate_queryset(queryset, request)
+
         serialized_dialogs = []
-        for dialog in page:
+        for conversation in page:
             serialized_dialogs.append({
-                'id': dialog['id'],
-                'participant': MemberShortSerializer(dialog['participant']).data,
-                'last_message': MessageSerializer(dialog['last_message']).data if dialog['last_message'] else None,
-                'unread_count': dialog['unread_count']
+                'id': conversation.participant_id,
+                'participant': MemberShortSerializer(conversation.participant).data,
+                'last_message': MessageSerializer(conversation.last_message).data if conversation.last_message else None,
+                'unread_count': conversation.unread_count
             })
-        
+
         return paginator.get_paginated_response(serialized_dialogs)
 
 
@@ -750,37 +995,40 @@ class DialogMessagesView(APIView):
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    query_budget = {'get': 6, 'post': 9}
 
     @extend_schema(
         responses={200: MessageSerializer(many=True), 404: dict, 401: dict},
+        parameters=CURSOR_PARAMETERS + FIELDSET_PARAMETERS,
         description="Retrieve paginated list of messages from dialog with specific user"
     )
     def get(self, request, user_id):
+        fieldset = fieldsets.parse(request, fieldsets.MESSAGE)
         try:
-            other_user = Member.objects.get(id=user_id)
+            other_user = Member.objects.only('id').get(id=user_id)
         except Member.DoesNotExist:
             return Response(
                 {"error": "Not found", "detail": "User not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Get messages between users
-        queryset = Message.objects.filter(
-            Q(sender=request.user, receiver=other_user) | Q(sender=other_user, receiver=request.user)
-        ).order_by('-created_at')
+        # Get messages between users, one index-ordered arm per direction
+        arms = conversations.dialog_arms(request.user.id, other_user.id)
 
         # Mark incoming messages as read
-        Message.objects.filter(
-            sender=other_user,
-            receiver=request.user,
-            is_read=False
-        ).update(is_read=True)
+        with transaction.atomic():
+            Message.objects.filter(
+                sender=other_user,
+                receiver=request.user,
+                is_read=False
+            ).update(is_read=True)
+            conversations.mark_read(request.user.id, other_user.id)
 
-        paginator = self.pagination_class()
+        paginator = paginator_for(request, self.pagination_class)
         paginator.page_size = 50  # Override page size for messages
-        paginated_queryset = paginator.paginate_queryset(queryset, request)
-        serializer = MessageSerializer(paginated_queryset, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        lookups = fieldset.lookups('id', 'created_at')
+        page = paginator.paginate_queryset([arm.values(*lookups) for arm in arms], request)
+        return paginator.get_paginated_response(rows.render(page, fieldset))
 
     @extend_schema(
         request=MessageCreateSerializer,
@@ -798,7 +1046,10 @@ class DialogMessagesView(APIView):
 
         serializer = MessageCreateSerializer(data=request.data)
         if serializer.is_valid():
-            message = serializer.save(sender=request.user, receiver=receiver)
+            with transaction.atomic():
+                message = serializer.save(sender=request.user, receiver=receiver)
+                conversations.record_message(message)
+                transaction.on_commit(partial(notify.messages.notify, receiver.id, message.id))
             response_serializer = MessageSerializer(message)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -810,6 +1061,7 @@ class MessageDeleteView(APIView):
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'delete': 8}
 
     @extend_schema(
         responses={204: None, 403: dict, 404: dict, 401: dict},
@@ -825,20 +1077,106 @@ class MessageDeleteView(APIView):
             )
 
         # Check if user is the sender
-        if request.user.id != message.sender.id:
+        if request.user.id != message.sender_id:
             return Response(
                 {"error": "Permission denied", "detail": "You can only delete your own messages"},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        message.delete()
+        with transaction.atomic():
+            message.delete()
+            conversations.message_deleted(message)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class MessageWaitView(View):
+    """
+    Long-poll for messages sent to the current user.
+
+    An async view: while it waits, the request is an idle future in
+    api.notify rather than a worker thread or a polling loop, so it needs
+    to be served through config.asgi to scale. Under WSGI a waiting request
+    would hold a whole sync worker, so there the view answers at once, like
+    ``timeout=0``, and clients simply poll. DRF views are sync-only, so
+    authentication and serialization are called directly, on the shared
+    pool of notify.run_sync.
+    """
+    query_budget = {'get': 3}
+    max_results = 100
+
+    async def get(self, request):
+        authentication = TokenAuthentication()
+        try:
+            authenticated = await notify.run_sync(authentication.authenticate, request)
+        except AuthenticationFailed:
+            authenticated = None
+        if authenticated is None:
+            response = JsonResponse(
+                {"error": "Unauthorized", "detail": "Authentication credentials were not provided or are invalid"},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+            response['WWW-Authenticate'] = authentication.authenticate_header(request)
+            return response
+        user = authenticated[0]
+
+        limit = getattr(settings, 'MESSAGE_WAIT_TIMEOUT', 25) if isinstance(request, ASGIRequest) else 0
+        try:
+            after = int(request.GET['after'])
+            timeout = min(limit, max(0, float(request.GET.get('timeout', limit))))
+        except (KeyError, ValueError):
+            return JsonResponse(
+                {"error": "Invalid parameters", "detail": "'after' must be a message id and 'timeout' a number of seconds"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with notify.messages.listen(user.id) as arrived:
+            results = await notify.run_sync(self.newer_messages, user, after)
+            if not results and timeout:
+                await asyncio.wait([arrived], timeout=timeout)
+                results = await notify.run_sync(self.newer_messages, user, after)
+
+        return JsonResponse({
+            'results': results,
+            'last_id': results[-1]['id'] if results else after,
+        })
+
+    def newer_messages(self, user, after):
+        messages = Message.objects.filter(receiver=user, id__gt=after).order_by('id')[:self.max_results]
+        return MessageSerializer(messages, many=True).data
+
+
+class BatchView(APIView):
+    """
+    Apply several likes, comments, subscriptions and messages at once.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    # Includes one follower count read per unsubscribed member (feed.catch_up).
+    query_budget = {'post': 21}
+
+    @extend_schema(
+        request=BatchSerializer,
+        responses={200: BatchResultSerializer(many=True), 400: dict, 401: dict},
+        description=(
+            "Apply an ordered list of operations (like, unlike, comment, subscribe, unsubscribe, message) "
+            "in one transaction. Each result carries the status and body of the matching single-action "
+            "endpoint; operations with a 'key' already used within BATCH_IDEMPOTENCY_TTL are not applied "
+            "again and return their stored result"
+        )
+    )
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        results = batch.apply(request.user, serializer.validated_data['operations'])
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
 class HelloView(APIView):
     """
     A simple API endpoint that returns a greeting message.
     """
+    query_budget = {'get': 0}
 
     @extend_schema(
         responses={200: MessageSerializer}, description="Get a hello world message"
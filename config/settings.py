@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from config.sqlite import database_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -85,6 +87,7 @@ SPECTACULAR_SETTINGS = {
 }
 
 MIDDLEWARE = [
+    "api.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -112,18 +115,113 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "config.wsgi.application"
+ASGI_APPLICATION = "config.asgi.application"
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connection profiles (PRAGMAs, transaction mode, connection reuse) are
+# defined in config/sqlite.py.
+
+SQLITE_PROFILE = os.environ.get("SQLITE_PROFILE", "performance")
+
 DATABASES = {
+    "default": database_settings(
+        BASE_DIR / "persistent" / "db" / "db.sqlite3",
+        profile=SQLITE_PROFILE,
+    )
+}
+
+
+# Auth tokens
+# "opaque" issues keys stored in the tokens table; "signed" issues stateless
+# HMAC-signed tokens (api.signed_tokens). Both formats are always accepted.
+
+AUTH_TOKEN_FORMAT = os.environ.get("AUTH_TOKEN_FORMAT", "opaque")
+SIGNED_TOKEN_TTL = 14 * 24 * 3600
+SIGNED_TOKEN_REVOCATION_REFRESH = 5
+SIGNED_TOKEN_REVOCATION_REBUILD = 3600
+
+
+# Presence
+# Members count as online for PRESENCE_TTL seconds after their last request;
+# buffered activity is written to members.last_seen every
+# PRESENCE_FLUSH_INTERVAL seconds per worker.
+
+PRESENCE_TTL = 120
+PRESENCE_FLUSH_INTERVAL = 5
+
+# Image variants
+# Resized WebP copies of post images and avatars (api.images) are generated
+# by a pool of IMAGE_WORKERS threads per worker process after the upload
+# commits; 0 generates them inline.
+
+IMAGE_WORKERS = 2
+
+# Message long-poll
+# Longest time GET /api/messages/wait holds a request open (keep it below
+# the proxy's read timeout), and the threads per process that run its
+# queries while any number of requests wait. Only requests served through
+# config.asgi wait; under WSGI (the gunicorn sync deployment) the endpoint
+# answers immediately rather than tie up a worker.
+
+MESSAGE_WAIT_TIMEOUT = 25
+MESSAGE_WAIT_WORKERS = 4
+
+# Response cache
+# Anonymous pages of the post listings are cached in RESPONSE_CACHE_ALIAS for
+# up to RESPONSE_CACHE_TIMEOUT seconds and invalidated when their posts
+# change (api.response_cache). The file-based cache is shared by all
+# gunicorn workers. Hit/miss counts are flushed to the cache every
+# RESPONSE_CACHE_STATS_INTERVAL seconds per worker and passed to
+# RESPONSE_CACHE_STATS_HOOK (a dotted path to a callable), if set.
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "persistent" / "db" / "db.sqlite3",
-    }
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "responses": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "persistent" / "cache" / "responses",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
 }
 
+RESPONSE_CACHE_ALIAS = "responses"
+RESPONSE_CACHE_TIMEOUT = 60
+RESPONSE_CACHE_STATS_INTERVAL = 10
+RESPONSE_CACHE_STATS_HOOK = None
+
+# Multi-get
+# Most ids GET /api/posts?ids= and /api/users?ids= resolve in one request.
+
+MULTI_GET_MAX_IDS = 200
+
+# Batched writes
+# POST /api/batch applies at most BATCH_MAX_OPERATIONS operations in one
+# transaction. Results of operations sent with an idempotency key are kept
+# for BATCH_IDEMPOTENCY_TTL seconds; a replay within that time returns the
+# stored result instead of applying the operation again.
+
+BATCH_MAX_OPERATIONS = 100
+BATCH_IDEMPOTENCY_TTL = 24 * 60 * 60
+
+# Request metrics
+# Adds Server-Timing and X-Query-* headers to every response and logs
+# requests that exceed their view's query_budget.
+
+REQUEST_METRICS_ENABLED = True
+
+
+# Home feed fan-out
+# Authors with at least FEED_FANOUT_THRESHOLD subscribers are merged into
+# feeds at read time instead of being written to every follower's timeline.
+
+FEED_FANOUT_THRESHOLD = 10000
+FEED_BACKFILL_LIMIT = 100
+FEED_FANOUT_BATCH_SIZE = 1000
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -12,9 +12,14 @@ else
     echo "==> No existing database found, creating new one"
 fi
 
+# Cached responses refer to rows of the removed database
+echo "==> Clearing response cache..."
+rm -rf /app/persistent/cache
+
 # Create persistent dirs
 /bin/mkdir -p /app/persistent/db
 /bin/mkdir -p /app/persistent/media
+/bin/mkdir -p /app/persistent/cache
 
 # Run migrations
 echo "==> Running database migrations..."
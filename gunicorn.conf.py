@@ -19,7 +19,13 @@ graceful_timeout = 30
 accesslog = "-"
 errorlog = "-"
 loglevel = "info"
-access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(D)s'
+# Trailing key=value fields come from api.middleware.RequestMetricsMiddleware
+# and, for cached listings, api.response_cache
+access_log_format = (
+    '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(D)s '
+    'queries=%({x-query-count}o)s db_ms=%({x-query-time-ms}o)s serialize_ms=%({x-serialize-time-ms}o)s '
+    'cache=%({x-cache}o)s'
+)
 
 # Process naming
 proc_name = "django_api"